@@ -0,0 +1,123 @@
+import os
+import asyncio
+
+import metrics
+
+#admission control for heavy queries (the websocket query pipeline), per server process:
+#at most MAX_ACTIVE queries run at once, and at most PER_USER of them for the same user,
+#further queries wait in a FIFO queue of at most MAX_QUEUED entries and are rejected when it is full
+#a waiting query whose user is at the limit does not hold up the queries of other users behind it
+#0 disables the respective limit
+
+MAX_ACTIVE = int(os.environ.get("VOCABDICT_MAX_QUERIES", os.cpu_count() or 4))
+MAX_QUEUED = int(os.environ.get("VOCABDICT_QUERY_QUEUE", 32))
+PER_USER = int(os.environ.get("VOCABDICT_QUERIES_PER_USER", 2))
+
+#anonymous queries count against the client address, behind a reverse proxy that is the proxy's for everyone
+#list the proxy addresses (comma separated) to use the address they forward in X-Forwarded-For instead
+TRUSTED_PROXIES = {a.strip() for a in os.environ.get("VOCABDICT_TRUSTED_PROXIES", "").split(",") if a.strip()}
+
+metrics.describe("vocabdict_queries_active", "Queries running")
+metrics.describe("vocabdict_queries_queued", "Queries waiting for admission")
+metrics.describe("vocabdict_queries_rejected_total", "Queries rejected because the admission queue was full")
+metrics.describe("vocabdict_query_queue_seconds", "Time queries waited for admission")
+
+
+#the address of the client behind host: the last address in X-Forwarded-For not added by a trusted proxy,
+#as earlier entries can be set by the client itself; host itself if it is not a trusted proxy
+def client_address(host, forwarded_for=None):
+    if host not in TRUSTED_PROXIES or not forwarded_for:
+        return host
+    for address in reversed([a.strip() for a in forwarded_for.split(",")]):
+        if address and address not in TRUSTED_PROXIES:
+            return address
+    return host
+
+
+class QueueFull(Exception):
+    pass
+
+
+class _Waiter:
+    def __init__(self, user):
+        self.user = user
+        self.admitted = False
+        self.changed = asyncio.Event()
+
+
+class Admission:
+    def __init__(self, max_active=MAX_ACTIVE, max_queued=MAX_QUEUED, per_user=PER_USER):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.per_user = per_user
+
+        self.active = 0
+        self.active_per_user = {}
+        self.waiting = []
+
+    def _can_run(self, user):
+        if self.max_active and self.active >= self.max_active:
+            return False
+        return not self.per_user or self.active_per_user.get(user, 0) < self.per_user
+
+    def _admit(self, user):
+        self.active += 1
+        self.active_per_user[user] = self.active_per_user.get(user, 0) + 1
+
+    #admits waiting queries in order, as far as the limits allow, and tells the rest their new position
+    def _dispatch(self):
+        for waiter in list(self.waiting):
+            if self._can_run(waiter.user):
+                self.waiting.remove(waiter)
+                self._admit(waiter.user)
+                waiter.admitted = True
+            waiter.changed.set()
+        self._publish()
+
+    def _publish(self):
+        metrics.set_gauge("vocabdict_queries_active", self.active)
+        metrics.set_gauge("vocabdict_queries_queued", len(self.waiting))
+
+    #waits until a query of user may run, calling (and awaiting) on_position(position) whenever its queue position changes
+    #raises QueueFull if the query can neither run nor wait
+    async def acquire(self, user, on_position=None):
+        if not self.waiting and self._can_run(user):
+            self._admit(user)
+            self._publish()
+            return
+
+        if self.max_queued and len(self.waiting) >= self.max_queued:
+            metrics.inc("vocabdict_queries_rejected_total")
+            raise QueueFull()
+
+        #queries ahead in the queue may all be blocked at their user's limit, with a slot free for this one
+        waiter = _Waiter(user)
+        self.waiting.append(waiter)
+        self._dispatch()
+
+        with metrics.timed("vocabdict_query_queue_seconds"):
+            try:
+                position = None
+                while not waiter.admitted:
+                    if on_position and self.waiting.index(waiter) + 1 != position:
+                        position = self.waiting.index(waiter) + 1
+                        await on_position(position)
+                    if waiter.admitted:
+                        break
+                    waiter.changed.clear()
+                    await waiter.changed.wait()
+            except BaseException:
+                #cancelled (e.g. the client left) while waiting or right after being admitted
+                if waiter.admitted:
+                    self.release(user)
+                else:
+                    self.waiting.remove(waiter)
+                    self._dispatch()
+                raise
+
+    def release(self, user):
+        self.active -= 1
+        self.active_per_user[user] -= 1
+        if not self.active_per_user[user]:
+            del self.active_per_user[user]
+        self._dispatch()
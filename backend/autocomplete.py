@@ -0,0 +1,269 @@
+import os
+import sys
+import json
+import mmap
+import heapq
+import array
+import sqlite3
+
+#prefix and typo tolerant headword search for autocompletion
+#the index is built from the {lang}_offsets table into three files next to the dictionaries:
+#   {lang}_autocomplete.{generation}.txt   unique headwords as "word\tentries\n" lines, sorted by their utf-8 bytes
+#   {lang}_autocomplete.{generation}.off   uint64 start offset of every line (plus the end of the file), for binary search
+#   {lang}_autocomplete.json               generation, number of words, the alphabet used for typo variants and
+#                                          the best ranked words of every prefix with more than SCAN_LIMIT words
+#the .txt and .off files are memory mapped, so nothing is parsed at startup and workers share the pages
+#a rebuild writes a new generation and then swaps in the .json, so readers always open a matching set of files
+#build it with (build_index.py also does this after indexing):
+"""
+python autocomplete.py de
+"""
+
+INDEX_DIR = "./wiktionary"
+
+#maximum number of prefix matches that are ranked per lookup,
+#prefixes with more words (mostly one or two characters) are served from their precomputed best ranked words
+SCAN_LIMIT = 2000
+
+#number of best ranked words precomputed per such prefix, the most a lookup can return for them
+TOP_N = 50
+
+#number of most common characters used to generate typo variants
+ALPHABET_SIZE = 48
+
+#maximum number of typo variants looked up per fuzzy lookup, one binary search each
+#(a word of n characters has about 2 * (n + 1) * ALPHABET_SIZE variants)
+MAX_VARIANTS = 256
+
+
+#paths of the .txt and .off files of generation (the files of indices built before generations, if None) and the .json
+def index_paths(lang, directory=INDEX_DIR, generation=None):
+    base = os.path.join(directory, f"{lang}_autocomplete")
+    data = base if generation is None else f"{base}.{generation}"
+    return data + ".txt", data + ".off", base + ".json"
+
+
+#contents of the .json file of lang's index
+def read_meta(lang, directory=INDEX_DIR):
+    _, _, meta_path = index_paths(lang, directory)
+    with open(meta_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+#ranking of completions: the word equal to the prefix first, then words with more entries and shorter words
+def rank(word, count, prefix):
+    return (word != prefix, -count, len(word), word)
+
+
+#indices of the TOP_N best ranked words of every prefix with more than SCAN_LIMIT words, as {prefix: [index, ...]}
+#words is sorted, so the words of a prefix are a contiguous range, split by their next character into the ranges
+#of the prefixes one character longer
+def top_words(words, counts):
+    top = {}
+    stack = [("", 0, len(words))]
+    while stack:
+        prefix, lo, hi = stack.pop()
+        #lookups are lowercased, so prefixes with upper case characters are never looked up
+        if hi - lo <= SCAN_LIMIT or prefix != prefix.lower():
+            continue
+        if prefix:
+            top[prefix] = heapq.nsmallest(TOP_N, range(lo, hi), key=lambda i: rank(words[i], counts[i], prefix))
+
+        depth = len(prefix)
+        i = lo
+        while i < hi:
+            if len(words[i]) <= depth:
+                #the word equal to prefix, which sorts first
+                i += 1
+                continue
+            c = words[i][depth]
+            j = i + 1
+            while j < hi and len(words[j]) > depth and words[j][depth] == c:
+                j += 1
+            stack.append((prefix + c, i, j))
+            i = j
+    return top
+
+
+#writes the autocomplete index of lang from the offsets table in db
+def build(lang, db, directory=INDEX_DIR):
+    try:
+        previous = read_meta(lang, directory).get("generation")
+    except FileNotFoundError:
+        previous = None
+    generation = (previous or 0) + 1
+    txt_path, off_path, meta_path = index_paths(lang, directory, generation)
+
+    cur = db.cursor()
+
+    #the default (binary) collation sorts by utf-8 bytes, which is what the lookups bisect on
+    cur.execute(f"SELECT word, COUNT(*) FROM {lang}_offsets GROUP BY word ORDER BY word")
+
+    offsets = array.array("Q")
+    chars = {}
+    offset = 0
+    words, counts = [], []
+
+    #nothing reads the files of a new generation before the .json pointing to them is swapped in
+    with open(txt_path, "wb") as f:
+        for word, count in cur:
+            if not word or "\t" in word or "\n" in word:
+                continue
+
+            line = f"{word}\t{count}\n".encode("utf-8")
+            offsets.append(offset)
+            f.write(line)
+            offset += len(line)
+            words.append(word)
+            counts.append(count)
+
+            for c in word:
+                chars[c] = chars.get(c, 0) + 1
+
+    #end of the last line
+    offsets.append(offset)
+    with open(off_path, "wb") as f:
+        offsets.tofile(f)
+
+    alphabet = "".join(sorted(chars, key=chars.get, reverse=True)[:ALPHABET_SIZE])
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"generation": generation, "words": len(offsets) - 1, "alphabet": alphabet,
+                   "top": top_words(words, counts)}, f, ensure_ascii=False)
+    os.replace(meta_path + ".tmp", meta_path)
+
+    #the previous generation is kept for readers that read the old .json but did not open its files yet
+    keep = {index_paths(lang, directory, g)[i] for g in (generation, previous) for i in (0, 1)}
+    stale = {index_paths(lang, directory, None)[i] for i in (0, 1)}
+    prefix = f"{lang}_autocomplete."
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith(prefix) and name.split(".")[1].isdigit() and path not in keep:
+            stale.add(path)
+    for path in stale - keep:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    return len(offsets) - 1
+
+
+#all strings within one edit (deletion, substitution, insertion, transposition) of word, up to limit of them
+#returns {variant: unchanged head of word it starts with}, the likelier typos first: deletions and transpositions,
+#then substitutions and insertions of the alphabet's characters in order of their frequency
+def edits1(word, alphabet, limit=None):
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    variants = {}
+    for a, b in splits:
+        if b:
+            variants.setdefault(a + b[1:], a)
+        if len(b) > 1:
+            variants.setdefault(a + b[1] + b[0] + b[2:], a)
+    for c in alphabet:
+        if limit is not None and len(variants) > limit:
+            break
+        for a, b in splits:
+            if b and c != b[0]:
+                variants.setdefault(a + c + b[1:], a)
+            variants.setdefault(a + c + b, a)
+    variants.pop(word, None)
+    return dict(list(variants.items())[:limit])
+
+
+class AutocompleteIndex:
+    def __init__(self, lang, directory=INDEX_DIR):
+        _, _, meta_path = index_paths(lang, directory)
+
+        #modification time, to notice rebuilt indices, taken before reading so a rebuild in between is noticed later
+        self.mtime = os.path.getmtime(meta_path)
+
+        meta = read_meta(lang, directory)
+        self.size = meta["words"]
+        self.alphabet = meta["alphabet"]
+        self.top = meta.get("top", {})
+        txt_path, off_path, _ = index_paths(lang, directory, meta.get("generation"))
+
+        with open(txt_path, "rb") as f:
+            self.text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        with open(off_path, "rb") as f:
+            self.offsets = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)).cast("Q")
+
+    def line(self, i):
+        return self.text[self.offsets[i]: self.offsets[i + 1] - 1]
+
+    def word(self, i):
+        return self.line(i).split(b"\t", 1)[0]
+
+    #(word, entries) of the i-th word
+    def entry(self, i):
+        word, count = self.line(i).split(b"\t", 1)
+        return word.decode("utf-8"), int(count)
+
+    #index of the first word >= key, searching only words lo..hi
+    def lower_bound(self, key, lo=0, hi=None):
+        hi = self.size if hi is None else hi
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.word(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    #indices lo..hi of the words starting with prefix
+    def prefix_range(self, prefix):
+        key = prefix.encode("utf-8")
+        lo = self.lower_bound(key)
+        #0xff never occurs in utf-8, so this sorts after every word starting with key
+        return lo, self.lower_bound(key + b"\xff", lo)
+
+    #(word, entries) of up to limit words starting with prefix, searching only words lo..hi
+    def scan(self, prefix, limit, lo=0, hi=None):
+        hi = self.size if hi is None else hi
+        key = prefix.encode("utf-8")
+        i = self.lower_bound(key, lo, hi)
+        matches = []
+        while i < hi and len(matches) < limit and self.word(i).startswith(key):
+            matches.append(self.entry(i))
+            i += 1
+        return matches
+
+    #ranked completions of prefix: exact prefix matches first, then (if there are too few) matches of typo variants
+    #within a group, words with more entries and shorter words rank higher
+    def complete(self, prefix, limit=10, fuzzy=True):
+        prefix = prefix.lower()
+        if not prefix or not self.size:
+            return []
+
+        if prefix in self.top:
+            #too many words to rank them all
+            matches = [self.entry(i) for i in self.top[prefix]]
+        else:
+            matches = self.scan(prefix, SCAN_LIMIT)
+
+        ranked = sorted(matches, key=lambda m: rank(m[0], m[1], prefix))
+        results = [{"word": w, "entries": c, "fuzzy": False} for w, c in ranked[:limit]]
+
+        if fuzzy and len(results) < limit and len(prefix) > 1:
+            seen = {r["word"] for r in results}
+            candidates = {}
+            #variants sharing a head of prefix are only searched for among the words starting with that head
+            ranges = {}
+            for variant, head in edits1(prefix, self.alphabet, MAX_VARIANTS).items():
+                if head not in ranges:
+                    ranges[head] = self.prefix_range(head)
+                for word, count in self.scan(variant, limit, *ranges[head]):
+                    if word not in seen:
+                        candidates[word] = count
+
+            ranked = sorted(candidates.items(), key=lambda m: rank(m[0], m[1], None))
+            results += [{"word": w, "entries": c, "fuzzy": True} for w, c in ranked[: limit - len(results)]]
+
+        return results
+
+
+if __name__ == "__main__":
+    lang = sys.argv[1]  #e.g. 'de', 'en'
+
+    with sqlite3.connect(os.path.join(INDEX_DIR, "offsets.db")) as db:
+        print(f"Indexed {build(lang, db)} {lang} headwords for autocompletion")
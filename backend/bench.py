@@ -0,0 +1,708 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import timeit
+import sqlite3
+import socket
+import argparse
+import tempfile
+import subprocess
+import contextlib
+
+#reproducible benchmarks, run offline against a synthetic dictionary and stub models:
+"""
+python bench.py query --queries 200 --concurrency 1 8 --json bench.json
+python bench.py query --baseline bench.json    # exits with 1 if p95 latencies regressed
+python bench.py query --transport inprocess     # without the server, to profile the handler alone
+python bench.py transforms                      # append_add_keys/wipe on large entries
+python bench.py layout --scale 100              # offsets lookups, rowid table + index vs clustered table
+python bench.py dictfile                        # entry reads from the plain and the zstd framed dump
+"""
+#the synthetic dictionary is written in the kaikki format and indexed with build_index.py,
+#queries go to a uvicorn server started on a local port, over real websockets (--transport socket, the default),
+#or straight into the websocket handler (query_ws) with an in-memory websocket (--transport inprocess),
+#which leaves out the network, the websocket protocol and uvicorn, so its numbers are only comparable among themselves
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SYLLABLES = ["ka", "tze", "hund", "ber", "ge", "lau", "fen", "schn", "ell", "ma", "rin", "sto", "weg", "al", "ter", "mu", "sik", "zeit", "ung", "haus"]
+
+
+def make_word(rng, syllables=(2, 4)):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(*syllables)))
+
+
+def make_sentence(rng, words=(4, 10)):
+    return " ".join(make_word(rng, (1, 3)) for _ in range(rng.randint(*words))).capitalize() + "."
+
+
+#writes a synthetic de and en dictionary in the kaikki (wiktextract jsonl) format into directory/wiktionary
+#returns the german headwords
+def make_dictionaries(directory, words=2000, seed=0, target_lang="ko"):
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(directory, "wiktionary"), exist_ok=True)
+
+    en_words = list(dict.fromkeys(make_word(rng) for _ in range(words)))
+    de_words = list(dict.fromkeys(make_word(rng) for _ in range(words)))
+
+    with open(os.path.join(directory, "wiktionary", "en_dict.jsonl"), "w", encoding="utf-8") as f:
+        for word in en_words:
+            entry = {
+                "word": word,
+                "lang_code": "en",
+                "pos": "noun",
+                "senses": [{"glosses": [make_sentence(rng, (3, 8))]}],
+                "translations": [
+                    {"code": target_lang, "lang_code": target_lang, "word": make_word(rng)}
+                    for _ in range(rng.randint(0, 6))
+                ],
+            }
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    with open(os.path.join(directory, "wiktionary", "de_dict.jsonl"), "w", encoding="utf-8") as f:
+        for word in de_words:
+            #some words have several entries (e.g. noun and verb)
+            for pos in rng.sample(["noun", "verb", "adj"], rng.randint(1, 2)):
+                senses = []
+                translations = []
+                for j in range(rng.randint(1, 6)):
+                    sense_index = str(j + 1)
+                    senses.append({
+                        "sense_index": sense_index,
+                        "glosses": [make_sentence(rng, (3, 12))],
+                        "raw_tags": rng.sample(["umgangssprachlich", "veraltet", "fachsprachlich"], rng.randint(0, 1)),
+                        "examples": [{"text": make_sentence(rng)} for _ in range(rng.randint(0, 4))],
+                    })
+                    for _ in range(rng.randint(0, 4)):
+                        translations.append({"sense_index": sense_index, "lang_code": "en", "code": "en", "word": rng.choice(en_words)})
+                    for _ in range(rng.randint(0, 2)):
+                        translations.append({"sense_index": sense_index, "lang_code": target_lang, "code": target_lang, "word": make_word(rng)})
+
+                #inflected forms, plus a form-of entry for one of them
+                forms = [{"form": word + suffix, "tags": [tag]} for suffix, tag in (("en", "plural"), ("es", "genitive"))]
+                forms.append({"form": "de-decl", "tags": ["inflection-template"]})
+
+                entry = {"word": word, "lang_code": "de", "pos": pos, "senses": senses, "translations": translations, "forms": forms}
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+                if rng.random() < 0.2:
+                    stub = {"word": word + "en", "lang_code": "de", "pos": pos, "senses": [{"sense_index": "1", "glosses": [f"Plural von {word}"], "form_of": [{"word": word}]}]}
+                    f.write(json.dumps(stub, ensure_ascii=False) + "\n")
+
+    return de_words
+
+
+#builds the offsets index of the synthetic dictionaries with the regular build_index.py
+def build_indices(directory, langs=("de", "en")):
+    for lang in langs:
+        subprocess.run([sys.executable, os.path.join(BACKEND_DIR, "build_index.py"), lang], cwd=directory, check=True)
+
+
+#in-memory stand-in for the fastapi websocket, records the time of every message
+class BenchWebSocket:
+    def __init__(self, request):
+        self.request = request
+        self.start = None
+        self.messages = []
+
+    async def accept(self):
+        pass
+
+    async def receive_json(self):
+        self.start = time.perf_counter()
+        return self.request
+
+    #the client never sends anything else and never disconnects
+    async def receive(self):
+        await asyncio.Future()
+
+    async def send_text(self, text):
+        self.messages.append((time.perf_counter(), text))
+
+    async def send_json(self, data):
+        self.messages.append((time.perf_counter(), data))
+
+    async def close(self, code=1000, reason=None):
+        pass
+
+    #seconds from the request to the first message and to the result, and the result message
+    def timings(self):
+        first = self.messages[0][0] - self.start if self.messages else None
+        result = None
+        result_message = None
+        for at, message in self.messages:
+            #json messages are sent as text frames
+            if isinstance(message, str) and message.startswith("{"):
+                message = json.loads(message)
+            if isinstance(message, dict) and message.get("type") in ("result", "results"):
+                result = at - self.start
+                result_message = message
+        return first, result, result_message
+
+
+#a transport runs one request and returns the seconds to the first message and to the result (None if there was none),
+#and the result message
+
+#runs requests through the websocket handler of the imported query module
+def in_process(query):
+    async def run(request):
+        ws = BenchWebSocket(request)
+        await query.query_ws(ws)
+        return ws.timings()
+    return run
+
+
+#runs requests over a websocket connection to url, timed from before connecting
+def over_socket(url):
+    import websockets
+    from client import ws_query, QueryError
+
+    async def run(request):
+        start = time.perf_counter()
+        first = None
+
+        def on_progress(message):
+            nonlocal first
+            if first is None:
+                first = time.perf_counter() - start
+
+        try:
+            message = await ws_query(url, request, on_progress)
+        except (OSError, QueryError, websockets.exceptions.WebSocketException):
+            return first, None, None
+        result = time.perf_counter() - start
+        return (result if first is None else first), result, message
+    return run
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+#runs `uvicorn query:app` in directory, with its output in directory/server.log, and yields its websocket url
+@contextlib.contextmanager
+def uvicorn_server(directory, workers=1, timeout=60):
+    port = free_port()
+    with open(os.path.join(directory, "server.log"), "w") as log:
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "query:app", "--app-dir", BACKEND_DIR, "--host", "127.0.0.1",
+             "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+            cwd=directory, stdout=log, stderr=subprocess.STDOUT,
+        )
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if server.poll() is not None:
+                sys.exit(f"The server exited with status {server.returncode}, see {os.path.join(directory, 'server.log')}")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    sys.exit(f"The server did not start within {timeout}s")
+                time.sleep(0.1)
+        yield f"ws://127.0.0.1:{port}/ws/query"
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def summarize(values):
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": sum(values) / len(values) if values else 0.0,
+    }
+
+
+#runs queries through transport, concurrency at a time, and collects latency per stage
+async def run_queries(transport, words, lang, target_lang, tl_model, concurrency):
+    timings = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(word):
+        async with semaphore:
+            timings.append(await transport({"word": word, "lang": lang, "target_lang": target_lang, "tl_model": tl_model, "stats": True}))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(word) for word in words))
+    elapsed = time.perf_counter() - start
+
+    firsts, results, stages, counts, failed = [], [], {}, {}, 0
+    for first, result, message in timings:
+        if result is None:
+            failed += 1
+            continue
+        firsts.append(first)
+        results.append(result)
+        stats = message.get("stats", {})
+        for name, seconds in stats.get("stages", {}).items():
+            stages.setdefault(name, []).append(seconds)
+        for name, amount in stats.get("counts", {}).items():
+            counts[name] = counts.get(name, 0) + amount
+
+    return {
+        "concurrency": concurrency,
+        "queries": len(words),
+        "failed": failed,
+        "throughput_qps": len(results) / elapsed if elapsed else 0.0,
+        "first_message": summarize(firsts),
+        "result": summarize(results),
+        "stages": {name: summarize(values) for name, values in sorted(stages.items())},
+        "counts": counts,
+    }
+
+
+#result data of one query through transport
+async def query_result(transport, word, lang, target_lang, tl_model):
+    _, _, message = await transport({"word": word, "lang": lang, "target_lang": target_lang, "tl_model": tl_model})
+    return message["data"] if message else None
+
+
+#checks that a query for several target languages returns the same result per language as separate queries,
+#returns the list of mismatches
+async def check_multi_target(transport, words, lang, target_langs, tl_model):
+    mismatches = []
+    for word in words:
+        results = await query_result(transport, word, lang, target_langs, tl_model)
+        for tl in target_langs:
+            single = await query_result(transport, word, lang, tl, tl_model)
+            if results is None or results.get(tl) != single:
+                mismatches.append(f"{word} -> {tl}")
+    return mismatches
+
+
+def print_report(report):
+    print(f"\n{report['transport']}, concurrency {report['concurrency']}: {report['queries']} queries, {report['failed']} failed, "
+          f"{report['throughput_qps']:.1f} queries/s")
+    print(f"  {'stage':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = [("first message", report["first_message"]), ("result", report["result"])] + list(report["stages"].items())
+    for name, s in rows:
+        print(f"  {name:<22}{s['p50'] * 1000:>10.2f}{s['p95'] * 1000:>10.2f}{s['p99'] * 1000:>10.2f}")
+    if report["counts"]:
+        print("  counts: " + ", ".join(f"{k}={v}" for k, v in sorted(report["counts"].items())))
+
+
+#compares p95 latencies with a previous run over the same transport, returns the list of regressions
+#(reports from before transports were recorded ran in process)
+def compare_baseline(reports, baseline, tolerance):
+    regressions = []
+    previous = {(r.get("transport", "inprocess"), r["concurrency"]): r for r in baseline.get("reports", [])}
+
+    for report in reports:
+        old = previous.get((report["transport"], report["concurrency"]))
+        if not old:
+            continue
+        pairs = [("result", report["result"], old["result"])]
+        pairs += [(name, s, old["stages"][name]) for name, s in report["stages"].items() if name in old["stages"]]
+        for name, new_s, old_s in pairs:
+            #ignore noise on stages that take well under a millisecond
+            if new_s["p95"] > old_s["p95"] * (1 + tolerance) and new_s["p95"] - old_s["p95"] > 0.001:
+                regressions.append(f"concurrency {report['concurrency']}, {name}: p95 {old_s['p95'] * 1000:.2f}ms -> {new_s['p95'] * 1000:.2f}ms")
+
+    return regressions
+
+
+def bench_query(args):
+    directory = args.dir or tempfile.mkdtemp(prefix="vocabdict-bench-")
+    print(f"Benchmark directory: {directory}")
+
+    if not os.path.exists(os.path.join(directory, "wiktionary", "offsets.db")):
+        words = make_dictionaries(directory, args.words, args.seed, args.target_lang[0])
+        build_indices(directory)
+    else:
+        with open(os.path.join(directory, "wiktionary", "de_dict.jsonl"), encoding="utf-8") as f:
+            words = list(dict.fromkeys(json.loads(line)["word"] for line in f))
+
+    #stub models unless asked otherwise, must be set before query (and inference) are imported
+    if not args.real_models:
+        os.environ.setdefault("VOCABDICT_NLLB_BACKEND", "stub")
+        os.environ.setdefault("VOCABDICT_EMBED_BACKEND", "stub")
+
+    #all benchmark queries come from the same (unknown) client, admission limits would serialize them
+    os.environ.setdefault("VOCABDICT_MAX_QUERIES", "0")
+    os.environ.setdefault("VOCABDICT_QUERIES_PER_USER", "0")
+
+    with contextlib.ExitStack() as stack:
+        if args.transport == "socket":
+            #the server inherits the settings above
+            transport = over_socket(stack.enter_context(uvicorn_server(directory, args.server_workers)))
+        else:
+            #query.py resolves the dictionary and database paths relative to the working directory
+            os.chdir(directory)
+            sys.path.insert(0, BACKEND_DIR)
+            import query
+            transport = in_process(query)
+
+        reports = run_bench_queries(args, transport, words)
+
+    result = {"words": args.words, "seed": args.seed, "tl_model": args.tl_model, "transport": args.transport, "reports": reports}
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_baseline(reports, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for r in regressions:
+                print("  " + r)
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+#checks multi-target results and runs the benchmark at every concurrency level, returns the reports
+def run_bench_queries(args, transport, words):
+    rng = random.Random(args.seed)
+    sample = [rng.choice(words) for _ in range(args.queries)]
+
+    #several target languages are queried at once
+    target_lang = args.target_lang if len(args.target_lang) > 1 else args.target_lang[0]
+
+    if isinstance(target_lang, list):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            mismatches = asyncio.run(check_multi_target(transport, sample[:20], "de", target_lang, args.tl_model))
+        if mismatches:
+            print("Multi-target results differ from single-target results: " + ", ".join(mismatches))
+            sys.exit(1)
+        print(f"Multi-target results match single-target results ({min(len(sample), 20)} words)")
+
+    reports = []
+    for concurrency in args.concurrency:
+        #the query pipeline prints a lot, which should not end up in the report
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            #warm up (model loading, page cache) before measuring
+            asyncio.run(run_queries(transport, sample[:5], "de", target_lang, args.tl_model, 1))
+            report = asyncio.run(run_queries(transport, sample, "de", target_lang, args.tl_model, concurrency))
+        report["transport"] = args.transport
+        print_report(report)
+        reports.append(report)
+
+    return reports
+
+
+#the recursive append_add_keys/wipe/is_int_key as they were before the iterative rewrite,
+#kept as reference for correctness and speed
+def legacy_append_add_keys(obj, parent=None, key_in_parent=None):
+    if isinstance(obj, dict):
+        for k, v in list(obj.items()):
+            obj[k] = legacy_append_add_keys(v, obj, k)
+        if not obj:
+            obj["add"] = {}
+        if legacy_is_int_key(key_in_parent):
+            if isinstance(parent, dict):
+                parent["add"] = {}
+        return obj
+    elif isinstance(obj, list):
+        for i in range(len(obj)):
+            obj[i] = legacy_append_add_keys(obj[i], obj, i)
+        obj.append("add")
+        return obj
+    else:
+        return obj
+
+
+def legacy_is_int_key(key):
+    try:
+        int(key)
+        return True
+    except (ValueError, TypeError):
+        return False
+
+
+def legacy_wipe(data):
+    if isinstance(data, dict):
+        return {k: legacy_wipe(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return []
+    elif isinstance(data, str):
+        return ""
+    else:
+        return data
+
+
+#a fetch() shaped result with many entries, senses and examples
+def make_large_result(rng, entries=20, senses=30, examples=8, translations=15, lang="de", target_lang="ko"):
+    result = {}
+    for e in range(entries):
+        entry = {"word": make_word(rng), "type": "noun", "senses": {}}
+        for j in range(senses):
+            gloss = make_sentence(rng)
+            entry["senses"][str(j + 1)] = {
+                lang: gloss,
+                target_lang: gloss,
+                "tags": ["umgangssprachlich"],
+                "ex": {k: {lang: make_sentence(rng), target_lang: make_sentence(rng)} for k in range(examples)},
+                f"{target_lang}_tl": [make_word(rng) for _ in range(translations)],
+                "en_tl": [make_word(rng) for _ in range(translations)],
+            }
+        result[e * 1000] = entry
+    return result
+
+
+def bench_transforms(args):
+    rng = random.Random(args.seed)
+
+    if args.dir:
+        #real entries, fetched from an indexed dictionary with stub models
+        os.environ.setdefault("VOCABDICT_NLLB_BACKEND", "stub")
+        os.environ.setdefault("VOCABDICT_EMBED_BACKEND", "stub")
+        os.chdir(args.dir)
+        sys.path.insert(0, BACKEND_DIR)
+        import query
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            with sqlite3.connect(query.offsets_db) as db:
+                #by default the headwords with the most entries
+                words = args.word or [w for w, in db.execute(
+                    f"SELECT word FROM {args.lang}_offsets GROUP BY word ORDER BY COUNT(*) DESC LIMIT 3")]
+                results = [query.fetch(word.lower(), args.lang, args.target_lang, db.cursor()) for word in words]
+    else:
+        sys.path.insert(0, BACKEND_DIR)
+        import query
+        results = [make_large_result(rng) for _ in range(3)]
+
+    payload = json.dumps(results)
+    print(f"{len(results)} results, {len(payload) / 1024:.0f} KiB of json")
+
+    #same output as the legacy implementation
+    for result in results:
+        expected = legacy_append_add_keys(legacy_wipe(json.loads(json.dumps(result))))
+        actual = query.append_add_keys(query.wipe(json.loads(json.dumps(result))))
+        assert json.dumps(expected) == json.dumps(actual), "wipe/append_add_keys output differs from the legacy implementation"
+
+        expected = legacy_append_add_keys(json.loads(json.dumps(result)))
+        actual = query.append_add_keys(json.loads(json.dumps(result)))
+        assert json.dumps(expected) == json.dumps(actual), "append_add_keys output differs from the legacy implementation"
+
+    #every run transforms fresh copies, made up front so copying is not measured
+    copies = [[json.loads(payload) for _ in range(args.repeat)] for _ in range(4)]
+
+    def measure(fn, batch):
+        start = time.perf_counter()
+        for copy in batch:
+            for result in copy:
+                fn(result)
+        return (time.perf_counter() - start) / (len(batch) * len(results))
+
+    rows = [
+        ("append_add_keys", legacy_append_add_keys, query.append_add_keys, copies[0], copies[1]),
+        ("wipe", legacy_wipe, query.wipe, copies[2], copies[3]),
+    ]
+    print(f"  {'transform':<18}{'legacy ms':>12}{'current ms':>12}{'speedup':>10}")
+    for name, legacy, current, batch_a, batch_b in rows:
+        old = measure(legacy, batch_a)
+        new = measure(current, batch_b)
+        print(f"  {name:<18}{old * 1000:>12.3f}{new * 1000:>12.3f}{old / new:>9.1f}x")
+
+    #all keys the transforms check, as they occur in the results
+    keys = []
+    stack = list(results)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            keys.extend(node)
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    old = timeit.timeit(lambda: [legacy_is_int_key(k) for k in keys], number=5) / (5 * len(keys))
+    new = timeit.timeit(lambda: [query.is_int_key(k) for k in keys], number=5) / (5 * len(keys))
+    print(f"  {'is_int_key':<18}{old * 1e6:>10.3f}us{new * 1e6:>10.3f}us{old / new:>9.1f}x")
+
+
+#offsets table layouts: a rowid table with a separate word index (as built before), and clustered on (word, offset)
+LAYOUTS = {
+    "rowid+index": [
+        "CREATE TABLE offsets (word TEXT, offset INTEGER, hash INTEGER)",
+        "CREATE INDEX offsets_word ON offsets(word)",
+    ],
+    "clustered": [
+        "CREATE TABLE offsets (word TEXT, offset INTEGER, hash INTEGER, PRIMARY KEY (word, offset)) WITHOUT ROWID",
+    ],
+}
+
+
+def bench_layout(args):
+    directory = args.dir or tempfile.mkdtemp(prefix="vocabdict-bench-")
+    print(f"Benchmark directory: {directory}")
+
+    db_path = os.path.join(directory, "wiktionary", "offsets.db")
+    if not os.path.exists(db_path):
+        make_dictionaries(directory, args.words, args.seed)
+        build_indices(directory)
+
+    with sqlite3.connect(db_path) as db:
+        rows = db.execute(f"SELECT word, offset FROM {args.lang}_offsets").fetchall()
+
+    #copies of every headword under different names, to get to the size of a real dump
+    #(the hash column only needs to take up space, the original offset stands in for it)
+    size = max(offset for _, offset in rows) + 1
+    rows = [(word if k == 0 else f"{word}~{k}", offset + k * size, offset) for k in range(args.scale) for word, offset in rows]
+    words = list(dict.fromkeys(word for word, _, _ in rows))
+
+    rng = random.Random(args.seed)
+    sample = [rng.choice(words) for _ in range(args.lookups)]
+    print(f"{len(rows)} rows, {len(words)} headwords, {len(sample)} lookups")
+
+    results = {}
+    for name, ddl in LAYOUTS.items():
+        path = os.path.join(directory, f"layout-{name}.db")
+        if os.path.exists(path):
+            os.remove(path)
+
+        with sqlite3.connect(path) as db:
+            for statement in ddl:
+                db.execute(statement)
+            #in dump order, as the rows are found
+            db.executemany("INSERT INTO offsets VALUES (?, ?, ?)", sorted(rows, key=lambda r: r[1]))
+        db.close()
+
+        db = sqlite3.connect(path)
+        db.execute(f"PRAGMA cache_size = -{args.cache_kib}")
+        cur = db.cursor()
+        plan = " / ".join(row[-1] for row in cur.execute("EXPLAIN QUERY PLAN SELECT offset FROM offsets WHERE word = ?", ("x",)))
+
+        #warm up the page cache
+        for word in sample[:100]:
+            cur.execute("SELECT offset FROM offsets WHERE word = ?", (word,)).fetchall()
+
+        timings = []
+        for word in sample:
+            start = time.perf_counter()
+            cur.execute("SELECT offset FROM offsets WHERE word = ?", (word,)).fetchall()
+            timings.append(time.perf_counter() - start)
+        db.close()
+
+        results[name] = {"bytes": os.path.getsize(path), "plan": plan, "lookup": summarize(timings)}
+        os.remove(path)
+
+    print(f"  {'layout':<14}{'MiB':>8}{'p50 us':>10}{'p95 us':>10}{'p99 us':>10}  plan")
+    for name, r in results.items():
+        s = r["lookup"]
+        print(f"  {name:<14}{r['bytes'] / 2**20:>8.1f}{s['p50'] * 1e6:>10.1f}{s['p95'] * 1e6:>10.1f}{s['p99'] * 1e6:>10.1f}  {r['plan']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"rows": len(rows), "lookups": len(sample), "cache_kib": args.cache_kib, "layouts": results}, f, indent=2)
+
+
+def bench_dictfile(args):
+    directory = args.dir or tempfile.mkdtemp(prefix="vocabdict-bench-")
+    print(f"Benchmark directory: {directory}")
+
+    plain = os.path.join(directory, "wiktionary", f"{args.lang}_dict.jsonl")
+    if not os.path.exists(plain):
+        make_dictionaries(directory, args.words, args.seed)
+
+    sys.path.insert(0, BACKEND_DIR)
+    import dictfile
+
+    compressed = dictfile.compress(plain, args.frame_kib * 1024, args.level, out=os.path.join(directory, f"bench-{args.lang}_dict.jsonl.zst"))
+
+    offsets = [offset for offset, _ in dictfile.iter_lines(plain)]
+    rng = random.Random(args.seed)
+    sample = [rng.choice(offsets) for _ in range(args.lookups)]
+
+    sizes = {
+        "plain": os.path.getsize(plain),
+        "zstd": os.path.getsize(compressed) + os.path.getsize(dictfile.frames_path(compressed)),
+    }
+    print(f"{len(offsets)} entries, {sizes['plain'] / 2**20:.1f} MiB plain, {sizes['zstd'] / 2**20:.1f} MiB zstd "
+          f"({sizes['plain'] / sizes['zstd']:.1f}x), {args.frame_kib} KiB frames")
+
+    results = {}
+    for name, path, cached in (("plain", plain, True), ("zstd", compressed, False), ("zstd cached", compressed, True)):
+        timings = []
+        #a file per read, as fetch() opens the dump once per query
+        for offset in sample:
+            if not cached:
+                dictfile._frames.clear()
+            start = time.perf_counter()
+            with dictfile.open_dict(path) as f:
+                f.read_line(offset)
+            timings.append(time.perf_counter() - start)
+        results[name] = summarize(timings)
+
+    print(f"  {'dump':<14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, s in results.items():
+        print(f"  {name:<14}{s['p50'] * 1000:>10.3f}{s['p95'] * 1000:>10.3f}{s['p99'] * 1000:>10.3f}")
+
+    os.remove(compressed)
+    os.remove(dictfile.frames_path(compressed))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"entries": len(offsets), "frame_kib": args.frame_kib, "bytes": sizes, "read": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VocabDict benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_query = sub.add_parser("query", help="end-to-end websocket query latency per stage")
+    p_query.add_argument("--dir", help="reuse (or create) the synthetic dictionary in this directory")
+    p_query.add_argument("--words", type=int, default=2000, help="number of synthetic headwords")
+    p_query.add_argument("--queries", type=int, default=200)
+    p_query.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    p_query.add_argument("--target_lang", nargs="+", default=["ko"], help="several languages are queried at once")
+    p_query.add_argument("--tl_model", default="NLLB")
+    p_query.add_argument("--seed", type=int, default=0)
+    p_query.add_argument("--real_models", action="store_true", help="use the configured models instead of stubs")
+    p_query.add_argument("--transport", choices=["socket", "inprocess"], default="socket",
+                         help="query a local uvicorn server over websockets, or call the handler in this process")
+    p_query.add_argument("--server_workers", type=int, default=1, help="uvicorn workers of the server with --transport socket")
+    p_query.add_argument("--json", help="write the report to this file")
+    p_query.add_argument("--baseline", help="report of a previous run to compare against")
+    p_query.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95 slowdown")
+    p_query.set_defaults(func=bench_query)
+
+    p_transforms = sub.add_parser("transforms", help="append_add_keys/wipe on large entries, against the legacy recursive versions")
+    p_transforms.add_argument("--dir", help="directory with an indexed dictionary, to use real entries instead of synthetic ones")
+    p_transforms.add_argument("--word", nargs="+", help="words to fetch from --dir (default: the headwords with the most entries)")
+    p_transforms.add_argument("--lang", default="de")
+    p_transforms.add_argument("--target_lang", default="ko")
+    p_transforms.add_argument("--repeat", type=int, default=20)
+    p_transforms.add_argument("--seed", type=int, default=0)
+    p_transforms.set_defaults(func=bench_transforms)
+
+    p_layout = sub.add_parser("layout", help="offsets lookups on the rowid+index and the clustered table layout")
+    p_layout.add_argument("--dir", help="reuse (or create) the synthetic dictionary in this directory")
+    p_layout.add_argument("--words", type=int, default=2000, help="number of synthetic headwords")
+    p_layout.add_argument("--lang", default="de")
+    p_layout.add_argument("--scale", type=int, default=100, help="copies of the index, to reach the size of a real dump")
+    p_layout.add_argument("--lookups", type=int, default=20000)
+    p_layout.add_argument("--cache_kib", type=int, default=2000, help="sqlite page cache size")
+    p_layout.add_argument("--seed", type=int, default=0)
+    p_layout.add_argument("--json", help="write the results to this file")
+    p_layout.set_defaults(func=bench_layout)
+
+    p_dictfile = sub.add_parser("dictfile", help="entry reads from the plain and the zstd framed dump")
+    p_dictfile.add_argument("--dir", help="reuse (or create) the synthetic dictionary in this directory")
+    p_dictfile.add_argument("--words", type=int, default=2000, help="number of synthetic headwords")
+    p_dictfile.add_argument("--lang", default="de")
+    p_dictfile.add_argument("--frame_kib", type=int, default=256)
+    p_dictfile.add_argument("--level", type=int, default=19)
+    p_dictfile.add_argument("--lookups", type=int, default=2000)
+    p_dictfile.add_argument("--seed", type=int, default=0)
+    p_dictfile.add_argument("--json", help="write the results to this file")
+    p_dictfile.set_defaults(func=bench_dictfile)
+
+    args = parser.parse_args()
+    args.func(args)
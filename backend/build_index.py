@@ -1,46 +1,261 @@
-import json
-import sys
+import hashlib
 import sqlite3
+import argparse
+import dictfile
+import autocomplete
+import serialize
 
-lang = sys.argv[1] #e.g. 'de', 'en'
+#indexes a Kaikki jsonl dump for lookups:
+"""
+python build_index.py de                                                       # ./wiktionary/de_dict.jsonl
+python build_index.py de --incremental --dump ./wiktionary/de_dict-2026-10.jsonl  # refresh from a new dump
+python build_index.py de --dump ./wiktionary/de_dict.jsonl.zst                # compressed dump, see dictfile.py
+"""
+#the index is built into shadow tables next to the live ones and swapped in within one transaction,
+#so running servers keep answering from the old index (and the dump it points into) until the new one is complete
+#with --incremental, entries whose line is unchanged (same content hash) since the last build are taken over
+#from the live index, and only new or changed lines are parsed
+#download a new dump to a new file, the live index keeps pointing into the old one until the swap
 
-db = sqlite3.connect("./wiktionary/offsets.db")
-cur = db.cursor()
+OFFSETS_DB = "./wiktionary/offsets.db"
 
-#drop any existing tables
-cur.execute(f"DROP TABLE IF EXISTS {lang}_offsets")
+#rows are inserted in batches of this size
+BATCH_SIZE = 10000
 
-#create table
-cur.execute(f"CREATE TABLE IF NOT EXISTS {lang}_offsets (word TEXT,offset INTEGER)")
+#form tags that mark inflection table metadata instead of actual forms
+SKIP_FORM_TAGS = {"table-tags", "inflection-template", "class", "auxiliary", "romanization"}
 
-#define table index
-cur.execute(f"CREATE INDEX IF NOT EXISTS word_index ON {lang}_offsets(word)")
 
+#64 bit content hash of a dump line, as a signed sqlite integer
+def line_hash(line):
+    return int.from_bytes(hashlib.blake2b(line, digest_size=8).digest(), "big", signed=True)
 
-#builds the index list for the given jsonl wiktextract
-def build(path):
-    with open(path, 'rb') as f:
-        
-        #total offset in bytes
-        offset = 0
 
-        #iterate over all lines
-        for i, line in enumerate(f):
+#returns the (form, lemma) links of an entry: its own inflected forms, and the lemma it is a form of
+def form_links(entry, word):
+    links = []
+
+    for form in entry.get('forms', []):
+        text = form.get('form')
+        if not text or SKIP_FORM_TAGS.intersection(form.get('tags', [])):
+            continue
+        links.append((text.lower(), word))
+
+    #form-of entries (e.g. "ging") point to their lemma ("gehen")
+    for sense in entry.get('senses', []):
+        for lemma in sense.get('form_of', []) + sense.get('alt_of', []):
+            if lemma.get('word'):
+                links.append((word, lemma['word'].lower()))
+
+    return [(form, lemma) for form, lemma in links if form != lemma]
+
+
+def table_exists(cur, name):
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return cur.fetchone() is not None
+
+
+def has_column(cur, table, column):
+    return any(row[1] == column for row in cur.execute(f"PRAGMA table_info({table})"))
+
+
+#creates empty shadow tables for lang, dropping leftovers of an interrupted build
+def create_shadow_tables(cur, lang):
+    for table in ("offsets", "form_links", "forms"):
+        cur.execute(f"DROP TABLE IF EXISTS {lang}_{table}_new")
+
+    #clustered on (word, offset): all entries of a word are adjacent in the table's own b-tree,
+    #so a lookup is a single range scan without a separate index
+    #hash is the content hash of the entry's line, to find unchanged entries on the next refresh
+    cur.execute(f"""
+    CREATE TABLE {lang}_offsets_new (
+        word TEXT,
+        offset INTEGER,
+        hash INTEGER,
+        PRIMARY KEY (word, offset)
+    ) WITHOUT ROWID
+    """)
+
+    #rows are collected unordered here, and inserted into the clustered table sorted by its key
+    cur.execute("DROP TABLE IF EXISTS temp.staged_offsets")
+    cur.execute("CREATE TEMP TABLE staged_offsets (word TEXT, offset INTEGER, hash INTEGER)")
+
+    #inflected forms and form-of links as found in the entries, e.g. ("katzen", "katze"), ("ging", "gehen")
+    cur.execute(f"CREATE TABLE {lang}_form_links_new (form TEXT, lemma TEXT, hash INTEGER)")
+
+    #resolved form -> lemma entry offsets, so a lookup of an inflected form finds its lemma in one indexed probe
+    cur.execute(f"""
+    CREATE TABLE {lang}_forms_new (
+        form TEXT,
+        offset INTEGER,
+        PRIMARY KEY (form, offset)
+    ) WITHOUT ROWID
+    """)
+
+
+#hashes every line of the dump, as (offset, hash) rows of the temporary table dump_lines
+def hash_lines(cur, dump):
+    cur.execute("DROP TABLE IF EXISTS temp.dump_lines")
+    cur.execute("CREATE TEMP TABLE dump_lines (offset INTEGER PRIMARY KEY, hash INTEGER)")
+
+    rows = []
+
+    #offsets are in bytes of the uncompressed dump, also for compressed dumps
+    for offset, line in dictfile.iter_lines(dump):
+        rows.append((offset, line_hash(line)))
+        if len(rows) >= BATCH_SIZE:
+            cur.executemany("INSERT INTO dump_lines VALUES (?, ?)", rows)
+            rows = []
+
+    cur.executemany("INSERT INTO dump_lines VALUES (?, ?)", rows)
+
+
+#takes over the entries and links of all lines that are unchanged since the live index was built
+#returns the number of lines taken over
+def carry_over(cur, lang):
+    #one headword per content hash, identical lines are the same entry
+    cur.execute("DROP TABLE IF EXISTS temp.live_entries")
+    cur.execute("CREATE TEMP TABLE live_entries (hash INTEGER PRIMARY KEY, word TEXT)")
+    cur.execute(f"INSERT OR IGNORE INTO live_entries SELECT hash, word FROM {lang}_offsets")
+
+    cur.execute(f"""
+        INSERT INTO staged_offsets (word, offset, hash)
+        SELECT e.word, l.offset, l.hash
+        FROM dump_lines l
+        JOIN live_entries e ON e.hash = l.hash
+    """)
+    carried = cur.rowcount
+
+    cur.execute(f"""
+        INSERT INTO {lang}_form_links_new (form, lemma, hash)
+        SELECT DISTINCT form, lemma, hash
+        FROM {lang}_form_links
+        WHERE hash IN (SELECT hash FROM dump_lines)
+    """)
+
+    return carried
+
+
+#parses the lines of the dump that have no staged entry yet, in file order
+#returns the number of lines parsed
+def parse_changed(cur, lang, dump):
+    changed = cur.execute(f"""
+        SELECT offset, hash FROM dump_lines
+        WHERE hash NOT IN (SELECT hash FROM staged_offsets)
+        ORDER BY offset
+    """).fetchall()
+
+    offsets = []
+    links = []
+
+    with dictfile.open_dict(dump) as f:
+        for offset, h in changed:
+            line = f.read_line(offset)
 
             #load json from line
-            entry = json.loads(line.decode("utf-8"))
-            
+            entry = serialize.loads(line)
+
             word = entry.get('word', '*notdefined*').lower()
 
-            #inserts word and offset into db
-            cur.execute(f"INSERT INTO {lang}_offsets VALUES (?, ?)", (word, offset))
-            
-            #add offset
-            offset += len(line)
+            #collect word and offset, inserted into db in batches
+            offsets.append((word, offset, h))
+            links.extend((form, lemma, h) for form, lemma in form_links(entry, word))
+
+            if len(offsets) >= BATCH_SIZE:
+                cur.executemany("INSERT INTO staged_offsets VALUES (?, ?, ?)", offsets)
+                offsets = []
+            if len(links) >= BATCH_SIZE:
+                cur.executemany(f"INSERT INTO {lang}_form_links_new VALUES (?, ?, ?)", links)
+                links = []
+
+    cur.executemany("INSERT INTO staged_offsets VALUES (?, ?, ?)", offsets)
+    cur.executemany(f"INSERT INTO {lang}_form_links_new VALUES (?, ?, ?)", links)
+
+    return len(changed)
+
+
+#fills the clustered offsets table from the staged rows, in key order so pages are filled sequentially
+def insert_offsets(cur, lang):
+    cur.execute(f"""
+        INSERT INTO {lang}_offsets_new (word, offset, hash)
+        SELECT word, offset, hash FROM staged_offsets
+        ORDER BY word, offset
+    """)
+    cur.execute("DROP TABLE temp.staged_offsets")
+
+
+#resolves the form links to the offsets of all entries of their lemma
+def resolve_forms(cur, lang):
+    cur.execute(f"""
+        INSERT OR IGNORE INTO {lang}_forms_new (form, offset)
+        SELECT l.form, o.offset
+        FROM {lang}_form_links_new l
+        JOIN {lang}_offsets_new o ON o.word = l.lemma
+        ORDER BY l.form, o.offset
+    """)
+
+
+#replaces the live tables of lang with the shadow tables, and points lang to the new dump, in one transaction
+def swap(db, lang, dump):
+    cur = db.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        for table in ("offsets", "form_links", "forms"):
+            cur.execute(f"DROP TABLE IF EXISTS {lang}_{table}")
+            cur.execute(f"ALTER TABLE {lang}_{table}_new RENAME TO {lang}_{table}")
+
+        #the dump file every lang's offsets point into
+        cur.execute("CREATE TABLE IF NOT EXISTS dict_files (lang TEXT PRIMARY KEY, path TEXT)")
+        cur.execute("INSERT OR REPLACE INTO dict_files (lang, path) VALUES (?, ?)", (lang, dump))
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+
+
+#builds the index of lang from dump, reusing unchanged entries of the live index if incremental
+def build(db, lang, dump, incremental=False):
+    cur = db.cursor()
+
+    create_shadow_tables(cur, lang)
+    hash_lines(cur, dump)
+
+    #indices built before content hashes were stored cannot be diffed against
+    carried = 0
+    if incremental and table_exists(cur, f"{lang}_offsets") and has_column(cur, f"{lang}_offsets", "hash") \
+            and has_column(cur, f"{lang}_form_links", "hash"):
+        carried = carry_over(cur, lang)
+    elif incremental:
+        print(f"No content hashes in the live {lang} index, parsing every line")
+
+    parsed = parse_changed(cur, lang, dump)
+
+    insert_offsets(cur, lang)
+    resolve_forms(cur, lang)
+    cur.execute("DROP TABLE temp.dump_lines")
+    db.commit()
+
+    swap(db, lang, dump)
+
+    return carried, parsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index a Kaikki jsonl dump for lookups")
+    parser.add_argument("lang", help="language code of the dump, e.g. 'de', 'en'")
+    parser.add_argument("--dump", help="dump to index (default: ./wiktionary/{lang}_dict.jsonl)")
+    parser.add_argument("--incremental", action="store_true", help="only parse lines that changed since the last build")
+    parser.add_argument("--db", default=OFFSETS_DB)
+    args = parser.parse_args()
+
+    dump = args.dump or f"./wiktionary/{args.lang}_dict.jsonl"
 
+    db = sqlite3.connect(args.db)
 
+    carried, parsed = build(db, args.lang, dump, args.incremental)
+    print(f"Indexed {carried + parsed} {args.lang} entries ({parsed} parsed, {carried} unchanged)")
 
-build(f"./wiktionary/{lang}_dict.jsonl")
+    #sorted headword index for /autocomplete
+    autocomplete.build(args.lang, db)
 
-db.commit()
-db.close()
+    db.close()
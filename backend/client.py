@@ -1,30 +1,79 @@
-import requests
 import sys
-from query import pprint
+import json
 import time
+import asyncio
+import websockets
 
-word = sys.argv[1] if len(sys.argv) > 1 else print("Please provide a word as argument") or exit(1)
-tl_model = 'NLLB'
-if len(sys.argv) > 2:
-    tl_model = sys.argv[2]
+#runs one query against the websocket endpoint and prints the result:
+"""
+python client.py Katze [NLLB|Deepseek|DeepL] [ko,en,...]
+"""
 
-query_url = "http://127.0.0.1:8766/query?word={word}&lang={lang}&target_lang={target_lang}&tl_model={tl_model}&debug={debug}".format(word=word, lang="de", target_lang="ko", tl_model=tl_model, debug=False)
-payload = {
-    "word": word,
-    "lang": "de",
-    "target_lang": "ko",
-    "tl_model": tl_model,
-    "debug": False
-    }
+query_url = "ws://127.0.0.1:8766/ws/query"
 
 
-start_time = time.time()  # record start
-response = requests.get(query_url)
+#raised when the server answers a query with an error message, with its detail
+class QueryError(Exception):
+    pass
 
-if response.ok:
-    pprint(response.json())
-else:
-    print("Error:", response.status_code, response.text)
 
-end_time = time.time()  # record end
-print(f"Query took {end_time - start_time:.2f} seconds")
\ No newline at end of file
+#sends one query over the websocket, calls on_progress(message) for every progress message
+#on_connect() is called once the connection is open and on_message(message) with every raw message, the result included
+#returns the result message (a dict with "type": "result", or "results" for a list of target languages)
+async def ws_query(url, payload, on_progress=None, on_connect=None, on_message=None, open_timeout=10):
+    async with websockets.connect(url, max_size=None, open_timeout=open_timeout) as ws:
+        if on_connect:
+            on_connect()
+        await ws.send(json.dumps(payload))
+
+        async for message in ws:
+            if on_message:
+                on_message(message)
+
+            try:
+                decoded = json.loads(message)
+            except json.JSONDecodeError:
+                #plain text progress message
+                decoded = None
+
+            if isinstance(decoded, dict) and decoded.get("type") in ("result", "results"):
+                return decoded
+
+            if isinstance(decoded, dict) and decoded.get("type") == "error":
+                raise QueryError(decoded.get("detail"))
+
+            if on_progress:
+                on_progress(message)
+
+    raise ConnectionError("Connection closed before a result was received")
+
+
+if __name__ == "__main__":
+    from query import pprint
+
+    word = sys.argv[1] if len(sys.argv) > 1 else print("Please provide a word as argument") or exit(1)
+    tl_model = 'NLLB'
+    if len(sys.argv) > 2:
+        tl_model = sys.argv[2]
+
+    #several comma separated target languages are queried at once
+    target_lang = sys.argv[3].split(",") if len(sys.argv) > 3 else "ko"
+
+    payload = {
+        "word": word,
+        "lang": "de",
+        "target_lang": target_lang,
+        "tl_model": tl_model,
+        "debug": False
+        }
+
+    start_time = time.time()  # record start
+    try:
+        response = asyncio.run(ws_query(query_url, payload, on_progress=print))
+    except QueryError as e:
+        sys.exit(f"Query failed: {e}")
+
+    pprint(response["data"])
+
+    end_time = time.time()  # record end
+    print(f"Query took {end_time - start_time:.2f} seconds")
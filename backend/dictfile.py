@@ -0,0 +1,202 @@
+import os
+import array
+import bisect
+import argparse
+import functools
+import threading
+from collections import OrderedDict
+
+#random access to dictionary dumps, plain (.jsonl) or compressed as seekable zstd frames (.jsonl.zst)
+#a compressed dump is a sequence of independent zstd frames holding whole lines, plus a frame index next to it:
+#   {path}.frames   uint64 (uncompressed start, compressed start) of every frame, plus the end of the file
+#entries are addressed by their offset in the uncompressed dump in both cases, so the offsets index stays the same;
+#a lookup finds the frame containing the offset by binary search and decompresses only that frame
+#decompressed frames are kept in a small process wide LRU cache
+#compress a dump with:
+"""
+python dictfile.py compress ./wiktionary/de_dict.jsonl [--frame_kib 256] [--level 19]
+python build_index.py de --dump ./wiktionary/de_dict.jsonl.zst
+"""
+
+COMPRESSED_SUFFIX = ".zst"
+
+#uncompressed size a frame is filled up to, larger frames compress better but make every lookup decompress more
+FRAME_SIZE = 256 * 1024
+
+#number of decompressed frames kept in memory
+FRAME_CACHE = int(os.environ.get("VOCABDICT_FRAME_CACHE", 64))
+
+_frames = OrderedDict()
+_frames_lock = threading.Lock()
+
+
+def is_compressed(path):
+    return path.endswith(COMPRESSED_SUFFIX)
+
+
+def frames_path(path):
+    return path + ".frames"
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("Compressed dictionaries need the zstandard package (pip install zstandard)")
+    return zstandard
+
+
+#frame index of a compressed dump, cached per file version
+@functools.lru_cache(maxsize=32)
+def _frame_index(path, mtime_ns):
+    index = array.array("Q")
+    with open(frames_path(path), "rb") as f:
+        index.frombytes(f.read())
+    #uncompressed and compressed starts, each with the end of the file as last element
+    return index[0::2], index[1::2]
+
+
+#returns the decompressed frame i of a compressed dump, through the LRU cache
+def _frame(f, path, mtime_ns, cstarts, i):
+    key = (path, mtime_ns, i)
+    with _frames_lock:
+        data = _frames.get(key)
+        if data is not None:
+            _frames.move_to_end(key)
+            return data
+
+    f.seek(cstarts[i])
+    data = _zstd().ZstdDecompressor().decompress(f.read(cstarts[i + 1] - cstarts[i]))
+
+    with _frames_lock:
+        _frames[key] = data
+        while len(_frames) > FRAME_CACHE:
+            _frames.popitem(last=False)
+    return data
+
+
+#an open dump, plain or compressed
+class DictFile:
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "rb")
+
+        self.compressed = is_compressed(path)
+        if self.compressed:
+            self.mtime_ns = os.stat(frames_path(path)).st_mtime_ns
+            self.starts, self.cstarts = _frame_index(path, self.mtime_ns)
+
+    #the line starting at offset (in the uncompressed dump), including its newline
+    def read_line(self, offset):
+        if not self.compressed:
+            self.f.seek(offset)
+            return self.f.readline()
+
+        i = bisect.bisect_right(self.starts, offset) - 1
+        if i < 0 or i >= len(self.starts) - 1:
+            raise ValueError(f"Offset {offset} is outside of {self.path}")
+
+        data = _frame(self.f, self.path, self.mtime_ns, self.cstarts, i)
+        start = offset - self.starts[i]
+        end = data.find(b"\n", start)
+        return data[start: end + 1 if end >= 0 else len(data)]
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_dict(path):
+    return DictFile(path)
+
+
+#yields (offset, line) for every line of a dump, plain or compressed, in file order
+#starting with the line at offset start (which has to be the start of a line)
+def iter_lines(path, start=0):
+    offset = start
+
+    if not is_compressed(path):
+        with open(path, "rb") as f:
+            f.seek(start)
+            for line in f:
+                yield offset, line
+                offset += len(line)
+        return
+
+    #frames hold whole lines, so they can be split one at a time
+    starts, cstarts = _frame_index(path, os.stat(frames_path(path)).st_mtime_ns)
+    decompressor = _zstd().ZstdDecompressor()
+    first = max(bisect.bisect_right(starts, start) - 1, 0)
+    with open(path, "rb") as f:
+        f.seek(cstarts[first])
+        for i in range(first, len(cstarts) - 1):
+            data = decompressor.decompress(f.read(cstarts[i + 1] - cstarts[i]))
+            pos = max(start - starts[i], 0)
+            while pos < len(data):
+                end = data.find(b"\n", pos) + 1 or len(data)
+                yield starts[i] + pos, data[pos:end]
+                pos = end
+
+
+#compresses a plain dump into seekable frames, returns the path of the compressed dump
+def compress(path, frame_size=FRAME_SIZE, level=19, out=None):
+    out = out or path + COMPRESSED_SUFFIX
+    compressor = _zstd().ZstdCompressor(level=level, write_content_size=True)
+    index = array.array("Q")
+
+    uncompressed = 0
+    compressed = 0
+    chunk = []
+    chunk_size = 0
+
+    #write to temporary files and swap them in, so an index never sees a half written dump
+    with open(path, "rb") as src, open(out + ".tmp", "wb") as dst:
+
+        def flush():
+            nonlocal compressed, uncompressed, chunk, chunk_size
+            frame = compressor.compress(b"".join(chunk))
+            index.extend((uncompressed, compressed))
+            dst.write(frame)
+            compressed += len(frame)
+            uncompressed += chunk_size
+            chunk = []
+            chunk_size = 0
+
+        for line in src:
+            chunk.append(line)
+            chunk_size += len(line)
+            if chunk_size >= frame_size:
+                flush()
+        if chunk:
+            flush()
+
+    #end of the last frame
+    index.extend((uncompressed, compressed))
+    with open(frames_path(out) + ".tmp", "wb") as f:
+        index.tofile(f)
+
+    os.replace(frames_path(out) + ".tmp", frames_path(out))
+    os.replace(out + ".tmp", out)
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seekable compressed dictionary dumps")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_compress = sub.add_parser("compress", help="compress a jsonl dump into seekable zstd frames")
+    p_compress.add_argument("path")
+    p_compress.add_argument("--out", help="compressed dump (default: path + .zst)")
+    p_compress.add_argument("--frame_kib", type=int, default=FRAME_SIZE // 1024, help="uncompressed size of a frame")
+    p_compress.add_argument("--level", type=int, default=19, help="zstd compression level")
+    args = parser.parse_args()
+
+    out = compress(args.path, args.frame_kib * 1024, args.level, args.out)
+    before = os.path.getsize(args.path)
+    after = os.path.getsize(out) + os.path.getsize(frames_path(out))
+    print(f"Wrote {out}: {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB ({before / after:.1f}x)")
@@ -0,0 +1,97 @@
+import sqlite3
+
+#locating and parsing dictionary entries, shared by the api (query.py) and the batch jobs (pretranslate.py)
+
+#dump of a language, for indices built before dump files were recorded
+DICT_PATTERN = './wiktionary/*_dict.jsonl'
+
+#returns the dump file the offsets of lang point into, as recorded by build_index.py
+def dict_path(lang, cur):
+    try:
+        cur.execute("SELECT path FROM dict_files WHERE lang = ?", (lang,))
+        row = cur.fetchone()
+    except sqlite3.OperationalError:
+        #index built before dump files were recorded
+        row = None
+    return row[0] if row else DICT_PATTERN.replace('*', lang)
+
+
+#extracts word, type, senses (glosses and tags) and example sentences of a dictionary entry
+#glosses and examples are copied under target_lang as well, to be replaced by their translations
+def parse_entry(entry, lang, target_lang):
+    ret = {}
+
+    #original word
+    #TODO handle things like articles ("der", "die", "das") in german and capitalization in english
+    ret['word'] = entry.get('word')
+
+    #word type/position
+    ret['type'] = entry.get('pos')
+    
+    #iterate over all senses
+    senses = entry.get('senses', [])
+    ret['senses'] = {}
+
+    for j, sense in enumerate(senses):
+
+        id = sense.get('sense_index')
+
+        #initialize empty dict
+        ret['senses'][id] = {}
+
+        #iterate over all glosses and add to return
+        glosses = sense.get('glosses', [])
+        for gloss in glosses:
+            ret['senses'][id][lang] = gloss
+
+            #get translation
+            ret['senses'][id][target_lang] = gloss
+        
+        #get raw tags as simple categories, if they exist (rare)
+        #copied, as the same entry is parsed once per target language and each result is extended separately
+        ret['senses'][id]['tags'] = list(sense.get('raw_tags', []))
+
+        #get example sentences
+        ret['senses'][id].setdefault('ex', {})
+
+        for k, example in enumerate(sense.get('examples', [])):
+            ret['senses'][id]['ex'].setdefault(k, {})[lang] = example.get('text')
+        
+            #translate to target_lang as well
+            ret['senses'][id]['ex'].setdefault(k, {})[target_lang] = example.get('text')
+
+    return ret
+
+
+#collects every string of the result that needs to be translated, each distinct string once
+#returns the unique strings and, for each of them, the list of paths it goes to, e.g. [[entry, "senses", sense_id, "ko"], ...]
+#(glosses are copied verbatim into the target_lang slot, and glosses and examples recur across entries)
+def collect_to_be_translated(dict, lang, target_lang):
+    #string -> list of paths it was found at, in order of first occurrence
+    fan_out = {}
+
+    #Iterate through all different entries associated with the original word
+    for entry in dict.keys():
+
+        #skip original word entry
+        if entry == lang:
+            continue
+
+        #Iterate through all senses of the entry
+        for sense_id in dict[entry]['senses'].keys():
+            
+            for content in dict[entry]['senses'][sense_id]:
+                #definitions in target lang
+                if content == target_lang:
+
+                    fan_out.setdefault(dict[entry]['senses'][sense_id][content], []).append(
+                        [entry, "senses", sense_id, content])
+                
+                #example sentences in target lang
+                if content == 'ex':
+                    for idx in dict[entry]['senses'][sense_id][content].keys():
+                            fan_out.setdefault(dict[entry]['senses'][sense_id][content][idx][target_lang], []).append(
+                                [entry, "senses", sense_id, content, idx, target_lang])
+        
+
+    return list(fan_out.keys()), list(fan_out.values())
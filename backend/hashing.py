@@ -0,0 +1,127 @@
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+
+import metrics
+
+#password hashing runs in a small dedicated process pool, so a burst of logins
+#cannot occupy the threadpool that serves all other (sync) endpoints
+
+#argon2 parameters, tunable through the environment (defaults are the argon2-cffi defaults)
+ARGON2_TIME_COST = int(os.environ.get("VOCABDICT_ARGON2_TIME_COST", 3))
+ARGON2_MEMORY_COST = int(os.environ.get("VOCABDICT_ARGON2_MEMORY_COST", 65536))  # KiB
+ARGON2_PARALLELISM = int(os.environ.get("VOCABDICT_ARGON2_PARALLELISM", 4))
+
+#number of hashing processes and the maximum number of hashes waiting for one
+HASH_WORKERS = int(os.environ.get("VOCABDICT_HASH_WORKERS", 2))
+HASH_QUEUE = int(os.environ.get("VOCABDICT_HASH_QUEUE", 32))
+
+metrics.describe("vocabdict_password_hash_seconds", "Time spent hashing/verifying passwords, including queue wait")
+metrics.describe("vocabdict_password_hash_queue_depth", "Password hashes queued or running")
+metrics.describe("vocabdict_password_hash_rejected_total", "Password hashes rejected because the queue was full")
+metrics.describe("vocabdict_password_hash_pool_restarts_total", "Hashing pools replaced after a worker process died")
+
+#hasher of the current (worker) process
+_ph = None
+
+
+def _get_hasher():
+    global _ph
+    if _ph is None:
+        _ph = PasswordHasher(
+            time_cost=ARGON2_TIME_COST,
+            memory_cost=ARGON2_MEMORY_COST,
+            parallelism=ARGON2_PARALLELISM,
+        )
+    return _ph
+
+
+#runs inside the worker processes
+def _hash(password):
+    return _get_hasher().hash(password)
+
+
+#runs inside the worker processes, returns (matches, new hash if the parameters changed)
+def _verify(password_hash, password):
+    ph = _get_hasher()
+    try:
+        ph.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False, None
+
+    if ph.check_needs_rehash(password_hash):
+        return True, ph.hash(password)
+    return True, None
+
+
+#raised when more than HASH_QUEUE hashes are waiting, or the workers keep dying
+class HashPoolBusy(Exception):
+    pass
+
+
+class HashPool:
+    def __init__(self, workers=HASH_WORKERS, max_queue=HASH_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self.executor = None
+
+    def _get_executor(self):
+        if self.executor is None:
+            #spawn, so the workers only import this module instead of inheriting the whole api process
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self.executor
+
+    #drops executor if it is still the current one, the next call starts a new one
+    def _discard(self, executor):
+        if self.executor is executor:
+            self.executor = None
+            metrics.inc("vocabdict_password_hash_pool_restarts_total")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    #runs fn in the pool, replacing the pool if a worker died (e.g. killed for running out of memory),
+    #which leaves a ProcessPoolExecutor broken for good; retried once with a new pool
+    async def _submit(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self._get_executor()
+            try:
+                return await loop.run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                self._discard(executor)
+        raise HashPoolBusy()
+
+    async def _run(self, op, fn, *args):
+        if self.pending >= self.max_queue:
+            metrics.inc("vocabdict_password_hash_rejected_total", op=op)
+            raise HashPoolBusy()
+
+        self.pending += 1
+        metrics.set_gauge("vocabdict_password_hash_queue_depth", self.pending)
+        start = time.perf_counter()
+        try:
+            return await self._submit(fn, *args)
+        finally:
+            self.pending -= 1
+            metrics.set_gauge("vocabdict_password_hash_queue_depth", self.pending)
+            metrics.observe("vocabdict_password_hash_seconds", time.perf_counter() - start, op=op)
+
+    async def hash(self, password):
+        return await self._run("hash", _hash, password)
+
+    async def verify(self, password_hash, password):
+        return await self._run("verify", _verify, password_hash, password)
+
+    #blocks until the workers exited, run it in a thread from async code
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,347 @@
+import os
+import time
+import argparse
+import threading
+import zlib
+import difflib
+
+import metrics
+
+#model loading for translation (NLLB) and semantic similarity (MiniLM) with selectable inference backends:
+#   torch - fp32 pytorch, on the gpu if there is one (default)
+#   int8  - dynamically quantised pytorch (int8 linear layers), cpu only
+#   onnx  - onnx runtime, loaded from the directory written by `python inference.py export`
+#   stub  - deterministic fake models without any ml dependencies, for offline benchmarks
+#
+#the backend is chosen per model through the environment:
+"""
+VOCABDICT_NLLB_BACKEND=int8 VOCABDICT_EMBED_BACKEND=onnx uvicorn query:app --host 127.0.0.1 --port 8766
+"""
+
+NLLB_MODEL = "facebook/nllb-200-distilled-600M"
+EMBED_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+BACKENDS = ("torch", "int8", "onnx", "stub")
+
+NLLB_BACKEND = os.environ.get("VOCABDICT_NLLB_BACKEND", "torch")
+EMBED_BACKEND = os.environ.get("VOCABDICT_EMBED_BACKEND", "torch")
+
+#exported onnx models live here
+MODEL_DIR = os.environ.get("VOCABDICT_MODEL_DIR", "./models")
+
+#NLLB language codes of the supported languages
+lang_code_map = {
+    "de": "deu_Latn",  # German
+    "ko": "kor_Hang",  # Korean
+    "en": "eng_Latn",  # English
+    "fr": "fra_Latn",  # French
+    "es": "spa_Latn",  # Spanish
+    # add more as needed
+}
+
+#loaded models, keyed by (model, backend), so each is only loaded once per process
+_models = {}
+_lock = threading.Lock()
+
+#the tokenizer is shared between requests, but its source language is per call
+_tokenizer_lock = threading.Lock()
+
+
+def check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported backend '{backend}'. Supported: {list(BACKENDS)}")
+
+
+def onnx_dir(model):
+    return os.path.join(MODEL_DIR, f"{model}-onnx")
+
+
+#stand-in for NLLB, "translates" by tagging every string with the target language
+class StubTranslator:
+    def translate(self, words, tgt):
+        return [f"<{tgt}> {w}" for w in words]
+
+
+#stand-in for MiniLM, embeds texts as hashed character trigram counts
+#so similar strings still get similar embeddings
+class StubEmbedder:
+    dim = 64
+
+    def encode(self, texts, normalize_embeddings=False, **kwargs):
+        import numpy as np
+
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            text = f"  {text.lower()} "
+            for j in range(len(text) - 2):
+                embeddings[i, zlib.crc32(text[j: j + 3].encode()) % self.dim] += 1
+
+        if normalize_embeddings:
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings
+
+
+def _load_nllb(backend):
+    if backend == "stub":
+        return None, StubTranslator()
+
+    from transformers import AutoTokenizer
+
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+        path = onnx_dir("nllb")
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"No exported onnx model in {path}, run `python inference.py export nllb` first")
+        return AutoTokenizer.from_pretrained(path), ORTModelForSeq2SeqLM.from_pretrained(path)
+
+    import torch
+    from transformers import AutoModelForSeq2SeqLM
+
+    tokenizer = AutoTokenizer.from_pretrained(NLLB_MODEL)
+    model = AutoModelForSeq2SeqLM.from_pretrained(NLLB_MODEL)
+    model.eval()
+
+    if backend == "int8":
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        model.to('cuda' if torch.cuda.is_available() else 'cpu')
+
+    return tokenizer, model
+
+
+def _load_embedder(backend):
+    if backend == "stub":
+        return StubEmbedder()
+
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "onnx":
+        path = onnx_dir("embedder")
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"No exported onnx model in {path}, run `python inference.py export embedder` first")
+
+        #prefer the quantised model, if one was exported
+        quantized = os.path.join(path, "onnx", "model_qint8_avx2.onnx")
+        kwargs = {"file_name": "onnx/model_qint8_avx2.onnx"} if os.path.exists(quantized) else {}
+        return SentenceTransformer(path, backend="onnx", model_kwargs=kwargs)
+
+    import torch
+
+    if backend == "int8":
+        model = SentenceTransformer(EMBED_MODEL, device="cpu")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    return SentenceTransformer(EMBED_MODEL)
+
+
+#returns (tokenizer, model) of NLLB for the given backend
+def load_nllb(backend=None):
+    backend = backend or NLLB_BACKEND
+    check_backend(backend)
+
+    with _lock:
+        if ("nllb", backend) not in _models:
+            with metrics.timed("vocabdict_model_load_seconds", model="nllb", backend=backend):
+                _models[("nllb", backend)] = _load_nllb(backend)
+        return _models[("nllb", backend)]
+
+
+#returns the sentence embedding model for the given backend
+def load_embedder(backend=None):
+    backend = backend or EMBED_BACKEND
+    check_backend(backend)
+
+    with _lock:
+        if ("embedder", backend) not in _models:
+            with metrics.timed("vocabdict_model_load_seconds", model="embedder", backend=backend):
+                _models[("embedder", backend)] = _load_embedder(backend)
+        return _models[("embedder", backend)]
+
+
+#loads the configured models ahead of the first query, returns the load time of each in seconds
+def warmup():
+    timings = {}
+    for name, load in (("nllb", load_nllb), ("embedder", load_embedder)):
+        start = time.perf_counter()
+        load()
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+#translates a list of strings from src to tgt (both NLLB codes, e.g. "deu_Latn")
+def translate(words, src, tgt, backend=None):
+    tokenizer, model = load_nllb(backend)
+
+    if isinstance(model, StubTranslator):
+        return model.translate(words, tgt)
+
+    with _tokenizer_lock:
+        tokenizer.src_lang = src
+        inputs = tokenizer(words, return_tensors="pt", padding=True, truncation=True)
+
+    inputs = inputs.to(model.device)
+    translated = model.generate(**inputs, forced_bos_token_id=tokenizer.convert_tokens_to_ids(tgt))
+
+    return tokenizer.batch_decode(translated, skip_special_tokens=True)
+
+
+#computes one candidate x sense cosine similarity matrix (numpy) per (senses, candidates) pair,
+#embedding all texts of all pairs in a single batch
+def similarity_matrices(pairs, backend=None):
+    texts = list(dict.fromkeys(text for senses, candidates in pairs for text in candidates + senses))
+    idx = {text: i for i, text in enumerate(texts)}
+
+    #with normalised embeddings, the cosine similarity is a plain dot product
+    embeddings = load_embedder(backend).encode(texts, normalize_embeddings=True)
+
+    matrices = []
+    for senses, candidates in pairs:
+        candidate_emb = embeddings[[idx[c] for c in candidates]]
+        sense_emb = embeddings[[idx[s] for s in senses]]
+        matrices.append(candidate_emb @ sense_emb.T)
+    return matrices
+
+
+#cosine similarity of every candidate to every sense, as a len(candidates) x len(senses) numpy matrix
+def similarity_matrix(senses, candidates, backend=None):
+    return similarity_matrices([(senses, candidates)], backend)[0]
+
+
+#exports a model for the onnx backend into MODEL_DIR
+def export(model, quantize=False):
+    path = onnx_dir(model)
+
+    if model == "nllb":
+        from transformers import AutoTokenizer
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+        ORTModelForSeq2SeqLM.from_pretrained(NLLB_MODEL, export=True).save_pretrained(path)
+        AutoTokenizer.from_pretrained(NLLB_MODEL).save_pretrained(path)
+
+        if quantize:
+            from optimum.onnxruntime import ORTQuantizer
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+            config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+            for name in os.listdir(path):
+                if name.endswith(".onnx"):
+                    quantizer = ORTQuantizer.from_pretrained(path, file_name=name)
+                    quantizer.quantize(save_dir=path, quantization_config=config)
+                    #replace the fp32 file with the quantised one, so the regular file names are loaded
+                    os.replace(os.path.join(path, name.replace(".onnx", "_quantized.onnx")), os.path.join(path, name))
+
+    elif model == "embedder":
+        from sentence_transformers import SentenceTransformer
+
+        embedder = SentenceTransformer(EMBED_MODEL, backend="onnx")
+        embedder.save_pretrained(path)
+
+        if quantize:
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+            export_dynamic_quantized_onnx_model(embedder, "avx2", path)
+
+    else:
+        raise ValueError(f"Unknown model '{model}', expected 'nllb' or 'embedder'")
+
+    print(f"Exported {model} to {path}")
+
+
+#german sample sentences, used when no sentence file is given to compare
+SAMPLE_SENTENCES = [
+    "Die Katze schläft auf dem Sofa.",
+    "weibliche Katze",
+    "Haustier, das Mäuse fängt",
+    "Ich habe heute keine Zeit.",
+    "Er ging gestern Abend ins Kino.",
+    "Ausruf der Überraschung oder des Bedauerns",
+    "Die Bank am Fluss war frisch gestrichen.",
+    "Sie hat ihr Geld zur Bank gebracht.",
+    "ein Gerät zum Messen der Zeit",
+    "Der Zug hatte zwanzig Minuten Verspätung.",
+]
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+#compares a backend against the fp32 torch reference on the same inputs
+def compare(model, backend, sentences, lang="de", target_lang="ko"):
+    print(f"Comparing {model} backend '{backend}' against 'torch' on {len(sentences)} sentences")
+
+    if model == "nllb":
+        src, tgt = lang_code_map[lang], lang_code_map[target_lang]
+
+        #warm up both, so loading is not measured
+        translate(sentences[:1], src, tgt, "torch")
+        translate(sentences[:1], src, tgt, backend)
+
+        reference, ref_time = _timed(translate, sentences, src, tgt, "torch")
+        candidate, cand_time = _timed(translate, sentences, src, tgt, backend)
+
+        exact = sum(r == c for r, c in zip(reference, candidate))
+        ratios = [difflib.SequenceMatcher(None, r, c).ratio() for r, c in zip(reference, candidate)]
+
+        for s, r, c in zip(sentences, reference, candidate):
+            if r != c:
+                print(f"  {s}\n    torch:   {r}\n    {backend}: {c}")
+
+        print(f"exact matches:         {exact}/{len(sentences)}")
+        print(f"mean char similarity:  {sum(ratios) / len(ratios):.3f}")
+        print(f"min char similarity:   {min(ratios):.3f}")
+
+    elif model == "embedder":
+        from sentence_transformers import util
+
+        load_embedder("torch").encode(sentences[:1])
+        load_embedder(backend).encode(sentences[:1])
+
+        reference, ref_time = _timed(load_embedder("torch").encode, sentences)
+        candidate, cand_time = _timed(load_embedder(backend).encode, sentences)
+
+        cosines = [util.cos_sim(r, c).item() for r, c in zip(reference, candidate)]
+
+        #the similarity of every sentence pair should stay (almost) the same
+        ref_sims = util.cos_sim(reference, reference)
+        cand_sims = util.cos_sim(candidate, candidate)
+        drift = (ref_sims - cand_sims).abs().max().item()
+
+        print(f"mean embedding cosine: {sum(cosines) / len(cosines):.4f}")
+        print(f"min embedding cosine:  {min(cosines):.4f}")
+        print(f"max pair score drift:  {drift:.4f}")
+
+    else:
+        raise ValueError(f"Unknown model '{model}', expected 'nllb' or 'embedder'")
+
+    print(f"torch:   {ref_time:.2f}s")
+    print(f"{backend}: {cand_time:.2f}s ({ref_time / cand_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export models and compare inference backends")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="export a model for the onnx backend")
+    p_export.add_argument("model", choices=["nllb", "embedder"])
+    p_export.add_argument("--quantize", action="store_true", help="also apply int8 dynamic quantisation")
+
+    p_compare = sub.add_parser("compare", help="compare a backend against the fp32 torch outputs")
+    p_compare.add_argument("model", choices=["nllb", "embedder"])
+    p_compare.add_argument("backend", choices=BACKENDS)
+    p_compare.add_argument("--sentences", help="file with one sentence per line")
+    p_compare.add_argument("--lang", default="de")
+    p_compare.add_argument("--target_lang", default="ko")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export(args.model, args.quantize)
+    else:
+        sentences = SAMPLE_SENTENCES
+        if args.sentences:
+            with open(args.sentences, encoding="utf-8") as f:
+                sentences = [line.strip() for line in f if line.strip()]
+        compare(args.model, args.backend, sentences, args.lang, args.target_lang)
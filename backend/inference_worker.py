@@ -0,0 +1,277 @@
+import os
+import time
+import queue
+import argparse
+import ipaddress
+import itertools
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+import inference
+
+#inference worker: runs NLLB translation and MiniLM similarity in a separate process,
+#so light api processes can share a few heavy model processes
+#start one or more workers and point the api at them (comma separated), with the same secret key for all of them:
+"""
+export VOCABDICT_WORKER_KEY=$(python -c "import secrets; print(secrets.token_hex(32))")
+python inference_worker.py --socket /tmp/vocabdict-inference-0.sock
+python inference_worker.py --socket /tmp/vocabdict-inference-1.sock
+VOCABDICT_INFERENCE_WORKERS=/tmp/vocabdict-inference-0.sock,/tmp/vocabdict-inference-1.sock uvicorn query:app --host 127.0.0.1 --port 8766 --workers 4
+"""
+#without VOCABDICT_INFERENCE_WORKERS the api runs the models in-process
+#
+#messages are pickled, so whoever can connect with the key can run code in the worker (and a worker in the api):
+#there is no default key, unix sockets are only accessible to the user running the worker,
+#and tcp listeners only bind to loopback addresses unless --allow_remote is given
+#
+#protocol: the client sends one request dict per message and receives ("ok", result) or ("error", message)
+#   {"op": "translate", "words": [...], "src": "deu_Latn", "tgt": "kor_Hang"} -> list of translations
+#   {"op": "similarity", "senses": [...], "candidates": [...]}                -> candidate x sense numpy matrix
+#   {"op": "warmup"}                                                           -> load time per model
+#requests arriving within a short window are batched into one model call
+
+#minimum length of the secret key
+MIN_KEY_LENGTH = 16
+
+
+#the shared secret of workers and api, from VOCABDICT_WORKER_KEY
+def authkey():
+    key = os.environ.get("VOCABDICT_WORKER_KEY", "")
+    if len(key) < MIN_KEY_LENGTH:
+        raise RuntimeError(f"Set VOCABDICT_WORKER_KEY to a secret of at least {MIN_KEY_LENGTH} characters for the inference workers, "
+                           "e.g. python -c \"import secrets; print(secrets.token_hex(32))\"")
+    return key.encode()
+
+
+#"host:port" for tcp, anything else is a unix socket path
+def parse_address(address):
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        return (host, int(port))
+    return address
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+#############Worker##############
+
+class Job:
+    def __init__(self, request):
+        self.request = request
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+#number of strings a request adds to a batch
+def job_size(job):
+    request = job.request
+    return len(request.get("words", [])) + len(request.get("senses", [])) + len(request.get("candidates", []))
+
+
+def run_translate(jobs, src, tgt, max_batch):
+    #identical strings from different requests are only translated once
+    words = list(dict.fromkeys(w for job in jobs for w in job.request["words"]))
+
+    translated = {}
+    for i in range(0, len(words), max_batch):
+        chunk = words[i: i + max_batch]
+        translated.update(zip(chunk, inference.translate(chunk, src, tgt)))
+
+    for job in jobs:
+        job.result = [translated[w] for w in job.request["words"]]
+
+
+def run_similarity(jobs):
+    pairs = [(job.request["senses"], job.request["candidates"]) for job in jobs]
+    for job, matrix in zip(jobs, inference.similarity_matrices(pairs)):
+        job.result = matrix
+
+
+def run_batch(batch, max_batch):
+    #group the jobs that can share a model call
+    groups = {}
+    for job in batch:
+        op = job.request.get("op")
+        key = (op, job.request.get("src"), job.request.get("tgt")) if op == "translate" else (op,)
+        groups.setdefault(key, []).append(job)
+
+    for key, jobs in groups.items():
+        try:
+            match key[0]:
+                case "translate":
+                    run_translate(jobs, key[1], key[2], max_batch)
+                case "similarity":
+                    run_similarity(jobs)
+                case "warmup":
+                    timings = inference.warmup()
+                    for job in jobs:
+                        job.result = timings
+                case _:
+                    raise ValueError(f"Unknown op '{key[0]}'")
+        except Exception as e:
+            for job in jobs:
+                job.error = f"{type(e).__name__}: {e}"
+        finally:
+            for job in jobs:
+                job.done.set()
+
+
+#collects jobs for up to window seconds (or max_batch strings) and runs them together
+def run_batches(jobs, window, max_batch):
+    while True:
+        batch = [jobs.get()]
+        size = job_size(batch[0])
+        deadline = time.monotonic() + window
+
+        while size < max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                job = jobs.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(job)
+            size += job_size(job)
+
+        run_batch(batch, max_batch)
+
+
+#serves one api connection, the connection is kept open for many requests
+def handle(conn, jobs):
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                return
+
+            job = Job(request)
+            jobs.put(job)
+            job.done.wait()
+
+            try:
+                conn.send(("ok", job.result) if job.error is None else ("error", job.error))
+            except OSError:
+                return
+
+
+def serve(address, window=0.01, max_batch=64, warmup=True, allow_remote=False):
+    address = parse_address(address)
+    key = authkey()
+
+    if isinstance(address, tuple) and not allow_remote and not is_loopback(address[0]):
+        raise SystemExit(f"Refusing to listen on {address[0]}, which is reachable from other hosts. "
+                         "Use a unix socket or a loopback address, or pass --allow_remote on a trusted network.")
+
+    #remove a stale socket of a previous run
+    if isinstance(address, str) and os.path.exists(address):
+        os.remove(address)
+
+    if warmup:
+        print(f"Loaded models in {inference.warmup()}")
+
+    jobs = queue.Queue()
+    threading.Thread(target=run_batches, args=(jobs, window, max_batch), daemon=True).start()
+
+    #the socket file is created accessible to the current user only
+    umask = os.umask(0o177) if isinstance(address, str) else None
+    try:
+        listener = Listener(address, authkey=key)
+    finally:
+        if umask is not None:
+            os.umask(umask)
+
+    with listener:
+        print(f"Inference worker listening on {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, AuthenticationError) as e:
+                #e.g. a client with the wrong authkey
+                print(f"Refused connection: {e}")
+                continue
+            threading.Thread(target=handle, args=(conn, jobs), daemon=True).start()
+
+
+#############Client##############
+
+class WorkerPool:
+    def __init__(self, addresses):
+        self.addresses = [parse_address(a) for a in addresses]
+        self.authkey = authkey()
+        self.counter = itertools.count()
+
+        #connections are not thread safe, so every thread gets its own
+        self.local = threading.local()
+
+    def _connection(self, i):
+        conns = self.local.__dict__.setdefault("conns", {})
+        if i not in conns:
+            conns[i] = Client(self.addresses[i], authkey=self.authkey)
+        return conns[i]
+
+    def _drop(self, i):
+        conn = self.local.__dict__.get("conns", {}).pop(i, None)
+        if conn is not None:
+            conn.close()
+
+    def _call(self, i, request):
+        conn = self._connection(i)
+        conn.send(request)
+        status, result = conn.recv()
+        if status == "error":
+            raise RuntimeError(f"Inference worker {self.addresses[i]} failed: {result}")
+        return result
+
+    #sends the request to the next worker (round robin), trying the others if it is unreachable
+    def call(self, request):
+        start = next(self.counter)
+        error = None
+
+        for k in range(len(self.addresses)):
+            i = (start + k) % len(self.addresses)
+            try:
+                return self._call(i, request)
+            except (OSError, EOFError) as e:
+                self._drop(i)
+                error = e
+
+        raise RuntimeError(f"No inference worker reachable: {error}")
+
+    def translate(self, words, src, tgt):
+        return self.call({"op": "translate", "words": words, "src": src, "tgt": tgt})
+
+    def similarity(self, senses, candidates):
+        return self.call({"op": "similarity", "senses": senses, "candidates": candidates})
+
+    #loads the models on every worker
+    def warmup(self):
+        return {str(address): self._call(i, {"op": "warmup"}) for i, address in enumerate(self.addresses)}
+
+
+#the pool configured by VOCABDICT_INFERENCE_WORKERS, or None to run the models in-process
+def pool_from_env():
+    addresses = [a.strip() for a in os.environ.get("VOCABDICT_INFERENCE_WORKERS", "").split(",") if a.strip()]
+    return WorkerPool(addresses) if addresses else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run NLLB/MiniLM inference for the api in a separate process")
+    parser.add_argument("--socket", default="/tmp/vocabdict-inference.sock", help="unix socket path or host:port")
+    parser.add_argument("--window", type=float, default=10, help="batching window in milliseconds")
+    parser.add_argument("--max_batch", type=int, default=64, help="maximum number of strings per model call")
+    parser.add_argument("--no_warmup", action="store_true", help="load the models on the first request instead")
+    parser.add_argument("--allow_remote", action="store_true", help="allow tcp listeners on addresses other than loopback")
+    args = parser.parse_args()
+
+    serve(args.socket, args.window / 1000, args.max_batch, not args.no_warmup, args.allow_remote)
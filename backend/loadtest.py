@@ -0,0 +1,160 @@
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import websockets
+
+from bench import summarize
+from client import ws_query, QueryError
+
+#load generator for the websocket query endpoint, against a running server:
+"""
+python loadtest.py --words words.txt --pairs de:ko de:en de:ko,en,ja --tl_model NLLB --sessions 500 --concurrency 50 --json run.json
+python loadtest.py ... --compare previous_run.json
+"""
+#every session opens its own websocket, sends one query and waits for the result
+#results are written as json, so runs of different builds can be compared
+
+
+#runs one query through client.ws_query, filling in record as it goes
+async def query(url, payload, timeout, record, start):
+    def on_connect():
+        record["connect"] = time.perf_counter() - start
+
+    def on_message(message):
+        record.setdefault("first_progress", time.perf_counter() - start)
+        record["bytes"] = len(message)
+
+    try:
+        await ws_query(url, payload, on_connect=on_connect, on_message=on_message, open_timeout=timeout)
+    except QueryError as e:
+        record["outcome"] = "error"
+        record["detail"] = str(e)
+        return
+    except ConnectionError:
+        #refused connections are errors (handled by the caller), open ones closed without a result are disconnects
+        if "connect" not in record:
+            raise
+        record["outcome"] = "disconnect"
+        return
+
+    record["result"] = time.perf_counter() - start
+    record["outcome"] = "ok"
+
+
+#runs one query session and returns its record
+async def session(url, payload, timeout):
+    target_lang = payload["target_lang"]
+    if isinstance(target_lang, list):
+        target_lang = ",".join(target_lang)
+    record = {"word": payload["word"], "pair": f"{payload['lang']}:{target_lang}", "tl_model": payload["tl_model"]}
+    start = time.perf_counter()
+
+    try:
+        await asyncio.wait_for(query(url, payload, timeout, record, start), timeout)
+    except asyncio.TimeoutError:
+        record["outcome"] = "timeout"
+    except websockets.exceptions.ConnectionClosed as e:
+        record["outcome"] = "disconnect"
+        record["detail"] = str(e)
+    except (OSError, websockets.exceptions.InvalidHandshake) as e:
+        record["outcome"] = "error"
+        record["detail"] = f"{type(e).__name__}: {e}"
+
+    return record
+
+
+async def run(args, words):
+    rng = random.Random(args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    records = []
+
+    async def one(i):
+        lang, target_lang = rng.choice(args.pairs).split(":")
+
+        #several comma separated target languages are queried at once
+        if "," in target_lang:
+            target_lang = target_lang.split(",")
+        payload = {
+            "word": words[i % len(words)] if args.in_order else rng.choice(words),
+            "lang": lang,
+            "target_lang": target_lang,
+            "tl_model": rng.choice(args.tl_model),
+        }
+        async with semaphore:
+            records.append(await session(args.url, payload, args.timeout))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.sessions)))
+    return records, time.perf_counter() - start
+
+
+def summarize_records(records, elapsed):
+    ok = [r for r in records if r["outcome"] == "ok"]
+    outcomes = {}
+    for r in records:
+        outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+
+    return {
+        "sessions": len(records),
+        "elapsed": elapsed,
+        "throughput_qps": len(ok) / elapsed if elapsed else 0.0,
+        "outcomes": outcomes,
+        "error_rate": outcomes.get("error", 0) / len(records) if records else 0.0,
+        "disconnect_rate": (outcomes.get("disconnect", 0) + outcomes.get("timeout", 0)) / len(records) if records else 0.0,
+        "connect": summarize([r["connect"] for r in records if "connect" in r]),
+        "first_progress": summarize([r["first_progress"] for r in records if "first_progress" in r]),
+        "result": summarize([r["result"] for r in ok]),
+    }
+
+
+def print_summary(summary, previous=None):
+    print(f"{summary['sessions']} sessions in {summary['elapsed']:.1f}s, {summary['throughput_qps']:.2f} results/s")
+    print("outcomes: " + ", ".join(f"{k}={v}" for k, v in sorted(summary["outcomes"].items())))
+    print(f"error rate {summary['error_rate']:.1%}, disconnect/timeout rate {summary['disconnect_rate']:.1%}")
+    print(f"  {'':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name in ("connect", "first_progress", "result"):
+        s = summary[name]
+        line = f"  {name:<16}{s['p50'] * 1000:>10.1f}{s['p95'] * 1000:>10.1f}{s['p99'] * 1000:>10.1f}"
+        if previous and previous.get(name, {}).get("p95"):
+            line += f"   (p95 {s['p95'] / previous[name]['p95'] - 1:+.0%} vs previous)"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent websocket load test for /ws/query")
+    parser.add_argument("--url", default="ws://127.0.0.1:8766/ws/query")
+    parser.add_argument("--words", help="file with one word per line (default: a few common german words)")
+    parser.add_argument("--pairs", nargs="+", default=["de:ko"], help="language pairs as lang:target_lang, or lang:target_lang,target_lang,...")
+    parser.add_argument("--tl_model", nargs="+", default=["NLLB"], help="translation models to pick from")
+    parser.add_argument("--sessions", type=int, default=100, help="total number of queries")
+    parser.add_argument("--concurrency", type=int, default=10, help="number of open sessions at a time")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds until a session counts as timed out")
+    parser.add_argument("--in_order", action="store_true", help="query the words in order instead of at random")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write summary and all session records to this file")
+    parser.add_argument("--compare", help="summary of a previous run to compare against")
+    args = parser.parse_args()
+
+    words = ["katze", "hund", "haus", "gehen", "bank", "schnell", "zeit", "herrje"]
+    if args.words:
+        with open(args.words, encoding="utf-8") as f:
+            words = [line.strip() for line in f if line.strip()]
+
+    records, elapsed = asyncio.run(run(args, words))
+    summary = summarize_records(records, elapsed)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["summary"]
+
+    print_summary(summary, previous)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "summary": summary, "sessions": records}, f, indent=2)
+
+    sys.exit(1 if summary["outcomes"].get("ok", 0) == 0 else 0)
@@ -0,0 +1,181 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+#minimal in-process metrics registry, rendered in the prometheus text format by the /metrics endpoint
+
+#histogram buckets in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+
+#name -> {labels: value}
+_counters = {}
+_gauges = {}
+
+#name -> {labels: [count per bucket..., +Inf count, sum]}
+_histograms = {}
+
+#name -> help text
+_help = {}
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def describe(name, text):
+    _help[name] = text
+
+
+#records a duration (or any other value) in the histogram name
+def observe(name, value, **labels):
+    key = _labels(labels)
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        row = series.get(key)
+        if row is None:
+            row = series[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                row[i] += 1
+        row[-2] += 1
+        row[-1] += value
+
+
+def inc(name, amount=1, **labels):
+    key = _labels(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges.setdefault(name, {})[_labels(labels)] = value
+
+
+def add_gauge(name, amount, **labels):
+    key = _labels(labels)
+    with _lock:
+        series = _gauges.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+
+
+#times the wrapped block and records it in the histogram name
+@contextmanager
+def timed(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+describe("vocabdict_query_stage_seconds", "Time spent per query pipeline stage, summed per query")
+describe("vocabdict_query_seconds", "Total time per query")
+
+
+#stage timings and counters of a single query
+#stages are summed per query, e.g. all file reads of a query count as one 'file_read' observation
+class QueryStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.counts = {}
+
+        #stages of one query can run in several threads, e.g. translations into several target languages
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.stages[name] = self.stages.get(name, 0) + time.perf_counter() - start
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "total": time.perf_counter() - self.start,
+                "stages": dict(self.stages),
+                "counts": dict(self.counts),
+            }
+
+    #records this query in the global metrics
+    def publish(self, **labels):
+        for name, seconds in self.stages.items():
+            observe("vocabdict_query_stage_seconds", seconds, stage=name, **labels)
+        for name, amount in self.counts.items():
+            inc(f"vocabdict_query_{name}_total", amount, **labels)
+        observe("vocabdict_query_seconds", time.perf_counter() - self.start, **labels)
+
+
+#resident set size of this process in bytes
+def process_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        #not linux, fall back to the peak rss (bytes on macos)
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+#proportional set size: resident memory with every page shared between processes (e.g. pre-forked workers sharing
+#the model weights) split between them, so summed over all workers it is their actual memory use
+#None where /proc/self/smaps_rollup is not available (not linux, or kernels before 4.14)
+def process_pss():
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+#label values escaped as the text format requires, so no value can break out of its quotes
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+#renders all metrics in the prometheus text exposition format
+def render():
+    out = []
+    with _lock:
+        for kind, store in (("counter", _counters), ("gauge", _gauges)):
+            for name, series in sorted(store.items()):
+                if name in _help:
+                    out.append(f"# HELP {name} {_help[name]}")
+                out.append(f"# TYPE {name} {kind}")
+                for key, value in series.items():
+                    out.append(f"{name}{_format_labels(key)} {value}")
+
+        for name, series in sorted(_histograms.items()):
+            if name in _help:
+                out.append(f"# HELP {name} {_help[name]}")
+            out.append(f"# TYPE {name} histogram")
+            for key, row in series.items():
+                for i, bound in enumerate(BUCKETS):
+                    out.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {row[i]}")
+                out.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {row[-2]}")
+                out.append(f"{name}_count{_format_labels(key)} {row[-2]}")
+                out.append(f"{name}_sum{_format_labels(key)} {row[-1]}")
+
+    return "\n".join(out) + "\n"
@@ -0,0 +1,135 @@
+import time
+import sqlite3
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import dictfile
+import serialize
+import translation_store
+import translators
+import entries
+from build_index import OFFSETS_DB
+
+#translates all glosses and example sentences of a dictionary ahead of time, into the translation store
+#that live queries consult before running a model:
+"""
+VOCABDICT_TRANSLATION_STORE=./wiktionary/translations.db python pretranslate.py de ko
+python pretranslate.py de ko --model DeepL --batch 50 --store ./wiktionary/translations.db
+VOCABDICT_WORKER_KEY=... VOCABDICT_INFERENCE_WORKERS=/tmp/w0.sock,/tmp/w1.sock python pretranslate.py de ko --jobs 2
+"""
+#entries are parsed with the same code as fetch() (entries.py), so the stored strings are exactly the ones queries look up
+#progress is checkpointed with every round of batches, an interrupted run continues where it stopped
+#strings that are already in the store (e.g. from live queries) are not translated again
+
+
+#unique translatable strings of a dump line, in order
+def entry_texts(line, offset, lang, target_lang):
+    entry = serialize.loads(line)
+    if entry.get('lang_code') != lang:
+        return []
+
+    texts, _ = entries.collect_to_be_translated({offset: entries.parse_entry(entry, lang, target_lang)}, lang, target_lang)
+    return [t for t in texts if isinstance(t, str) and t.strip()]
+
+
+class Pretranslator:
+    def __init__(self, lang, target_lang, model, dump, batch_size, jobs, store):
+        self.lang = lang
+        self.target_lang = target_lang
+        self.model = model
+        self.dump = dump
+        self.batch_size = batch_size
+        self.jobs = jobs
+
+        #translations are looked up and stored under the model (and backend) that produces them
+        self.key = translators.model_key(model)
+
+        self.conn = translation_store.connect(store)
+        self.executor = ThreadPoolExecutor(jobs)
+
+        self.translated = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def translate_batch(self, batch):
+        return translators.translate_with_model(batch, self.lang, self.target_lang, self.model)
+
+    #translates the pending strings and stores them together with the offset all entries before are done up to
+    def flush(self, pending, offset):
+        stored = translation_store.lookup(self.conn, self.lang, self.target_lang, self.key, pending)
+        missing = [t for t in pending if t not in stored]
+        self.skipped += len(pending) - len(missing)
+
+        #similar lengths in a batch keep the padding small
+        missing.sort(key=len)
+        batches = [missing[i: i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+
+        #pairs per model that produced them, e.g. NLLB for batches Deepseek failed on
+        pairs = {}
+        for batch, (translated, model) in zip(batches, self.executor.map(self.translate_batch, batches)):
+            #translations that cannot be matched to their strings are not stored, live queries translate them later
+            if not isinstance(translated, list) or len(translated) != len(batch):
+                self.failed += len(batch)
+                continue
+            pairs.setdefault(model, []).extend(zip(batch, translated))
+            self.translated += len(batch)
+
+        for model, model_pairs in pairs.items():
+            translation_store.store(self.conn, self.lang, self.target_lang, model, model_pairs)
+        translation_store.set_progress(self.conn, self.lang, self.target_lang, self.key, self.dump, offset)
+        self.conn.commit()
+
+    def run(self):
+        start = translation_store.get_progress(self.conn, self.lang, self.target_lang, self.key, self.dump)
+        if start:
+            print(f"Resuming {self.dump} at byte {start}")
+
+        started = time.perf_counter()
+        pending = {}
+
+        #end of the last line read
+        end = start
+
+        for offset, line in dictfile.iter_lines(self.dump, start):
+            for text in entry_texts(line, offset, self.lang, self.target_lang):
+                pending[text] = None
+            end = offset + len(line)
+
+            #a round is one batch per job, checkpointed after the line it ended with
+            if len(pending) >= self.batch_size * self.jobs:
+                self.flush(list(pending), end)
+                pending = {}
+
+                elapsed = time.perf_counter() - started
+                print(f"{end} bytes, {self.translated} strings translated ({self.translated / elapsed:.1f}/s), "
+                      f"{self.skipped} already stored, {self.failed} failed", flush=True)
+
+        self.flush(list(pending), end)
+        self.executor.shutdown()
+        self.conn.close()
+
+        print(f"Done: {self.translated} strings translated, {self.skipped} already stored, {self.failed} failed, "
+              f"{time.perf_counter() - started:.0f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Translate all glosses and examples of a dictionary into the translation store")
+    parser.add_argument("lang", help="language of the dictionary, e.g. 'de'")
+    parser.add_argument("target_lang", help="language to translate into, e.g. 'ko'")
+    parser.add_argument("--model", default="NLLB", choices=translators.TL_MODELS)
+    parser.add_argument("--dump", help="dump to translate (default: the one the offsets index of lang points into)")
+    parser.add_argument("--batch", type=int, default=64, help="strings per model call")
+    parser.add_argument("--jobs", type=int, default=1, help="model calls running at the same time, e.g. one per inference worker")
+    parser.add_argument("--store", default=translation_store.STORE_DB or translation_store.DEFAULT_DB,
+                        help="translation store (default: VOCABDICT_TRANSLATION_STORE, or ./wiktionary/translations.db)")
+    args = parser.parse_args()
+
+    dump = args.dump
+    if not dump:
+        with sqlite3.connect(OFFSETS_DB) as db:
+            dump = entries.dict_path(args.lang, db.cursor())
+
+    if args.store != translation_store.STORE_DB:
+        print(f"Queries only use the store if started with VOCABDICT_TRANSLATION_STORE={args.store}")
+
+    Pretranslator(args.lang, args.target_lang, args.model, dump, args.batch, args.jobs, args.store).run()
@@ -1,14 +1,37 @@
+import time
+#start of the import, to measure startup time
+_import_start = time.perf_counter()
+
+import os
+import re
 import sys
+import hmac
 import json
+import functools
+import threading
 import sqlite3
+import tempfile
 from tqdm import tqdm
-from fastapi import Body, FastAPI, Path, WebSocket, WebSocketDisconnect, HTTPException, Header
+from fastapi import Body, FastAPI, Path, Request, WebSocket, WebSocketDisconnect, HTTPException, Header
+from fastapi.responses import Response, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
 import asyncio
 from contextlib import asynccontextmanager
 from jose import jwt, JWTError
+import requests
 from datetime import datetime, timedelta, timezone
-from argon2 import PasswordHasher
+
+import metrics
+import admission
+import dictfile
+import serialize
+import translation_store
+import autocomplete
+import inference
+import translators
+from translators import TL_MODELS, model_key, translate_with_model, openrouter_api_key
+from entries import dict_path, parse_entry, collect_to_be_translated
+from hashing import HashPool, HashPoolBusy
 
 #run this app with:
 """
@@ -18,7 +41,7 @@ uvicorn query:app --reload --host 127.0.0.1 --port 8766
 #to verify and decode jwt tokens
 def decode_jwt(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms="HS256")
+        payload = jwt.decode(token, secret_key(), algorithms="HS256")
         return payload.get("user_id")
     except JWTError:
         return None
@@ -50,17 +73,30 @@ def verify_user_token(authorization: str):
     
     return user_id
 
+#token for operator endpoints (e.g. /warmup), sent as "Authorization: Bearer <token>", those endpoints are disabled without it
+ADMIN_TOKEN = os.environ.get("VOCABDICT_ADMIN_TOKEN", "")
+
+def verify_admin_token(authorization: str):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not authorization or not hmac.compare_digest(authorization.encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Missing or invalid admin token")
+
 
 app = FastAPI()
 
-path = './wiktionary/*_dict.jsonl'
+offsets_db = './wiktionary/offsets.db'
 
 # load the open router (or any) api key
 def load_OR_key(path="OR_key.txt"):
     with open(path, "r") as f:
         return f.read().strip()
 
-SECRET_KEY = load_OR_key(path="jwt_key.txt")
+#keys are only read on first use, so workers start without (and without touching) keys they never need
+@functools.cache
+def secret_key():
+    return load_OR_key(path="jwt_key.txt")
+
 DB_FILE = "vocab_data.sqlite"
 
 @asynccontextmanager
@@ -117,11 +153,55 @@ async def lifespan(app: FastAPI):
 
     conn.commit()
     conn.close()
+
+    #memory map the autocomplete indices of all indexed languages
+    for name in os.listdir(autocomplete.INDEX_DIR) if os.path.isdir(autocomplete.INDEX_DIR) else []:
+        if name.endswith("_autocomplete.json"):
+            get_autocomplete_index(name.split("_")[0])
+
+    #models are loaded on first use, unless warm-up on startup is requested
+    #the task is kept on app.state, as the loop only holds a weak reference to it
+    if os.environ.get("VOCABDICT_WARMUP") == "1":
+        app.state.warmup = asyncio.create_task(asyncio.to_thread(warmup_models))
+        app.state.warmup.add_done_callback(log_warmup)
+
+    startup = time.perf_counter() - _import_start
+    metrics.set_gauge("vocabdict_startup_seconds", startup)
+    print(f"Started in {startup:.2f}s, rss {metrics.process_rss() / 2**20:.0f} MiB")
+
     yield
 
-app = FastAPI(lifespan=lifespan)
+    #waits for the hashing processes, off the event loop
+    await asyncio.to_thread(hash_pool.shutdown)
+
+app = FastAPI(lifespan=lifespan, default_response_class=serialize.JSONResponse)
+
+#records the latency of every http request, per route
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.observe(
+        "vocabdict_http_request_seconds",
+        time.perf_counter() - start,
+        method=request.method,
+        route=route.path if route else "unmatched",
+    )
+    return response
+
+metrics.describe("vocabdict_http_request_seconds", "Latency of http requests per route")
 
-ph = PasswordHasher()
+@app.get("/metrics")
+def get_metrics():
+    metrics.set_gauge("vocabdict_process_rss_bytes", metrics.process_rss())
+    pss = metrics.process_pss()
+    if pss is not None:
+        metrics.set_gauge("vocabdict_process_pss_bytes", pss)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+#argon2 hashing happens in a separate, bounded process pool
+hash_pool = HashPool()
 class UserCreate(BaseModel):
     username: str
     password: str
@@ -135,7 +215,7 @@ def create_token(user_id: int):
         "user_id": user_id,
         "exp": datetime.now(timezone.utc) + timedelta(days=1)
     }
-    return jwt.encode(payload, SECRET_KEY, algorithm="HS256")
+    return jwt.encode(payload, secret_key(), algorithm="HS256")
 
 def get_user_by_username(username: str):
     conn = sqlite3.connect(DB_FILE)
@@ -145,40 +225,64 @@ def get_user_by_username(username: str):
     conn.close()
     return row  # returns (id, username, password_hash) or None
 
+#inserts a user, returns False if the username is taken
+def create_user(username: str, password_hash: str):
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        with conn:
+            conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, password_hash))
+    except sqlite3.IntegrityError:
+        return False
+    finally:
+        conn.close()
+    return True
+
+def update_password_hash(user_id: int, password_hash: str):
+    conn = sqlite3.connect(DB_FILE)
+    conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (password_hash, user_id))
+    conn.commit()
+    conn.close()
+
+#register and login await the hash pool, so they stay async and run their database work in threads
 @app.post("/register")
-def register(user: UserCreate):
+async def register(user: UserCreate):
     print("Registering user:", user.username)
-    print("Password (plain):", user.password)
-    if get_user_by_username(user.username):
+    if await asyncio.to_thread(get_user_by_username, user.username):
         raise HTTPException(status_code=400, detail="Username already exists, please login instead.")
 
     # Use argon2 to hash the password
-    password_hash = ph.hash(user.password)
+    try:
+        password_hash = await hash_pool.hash(user.password)
+    except HashPoolBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please try again later.")
 
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO users (username, password_hash) VALUES (?, ?)",
-        (user.username, password_hash)
-    )
-    conn.commit()
-    conn.close()
+    #the username may have been taken while hashing
+    if not await asyncio.to_thread(create_user, user.username, password_hash):
+        raise HTTPException(status_code=400, detail="Username already exists, please login instead.")
     
     return {"status": "ok"}
 
 @app.post("/login")
-def login(user: UserLogin):
-    db_user = get_user_by_username(user.username)
+async def login(user: UserLogin):
+    db_user = await asyncio.to_thread(get_user_by_username, user.username)
     if not db_user:
         raise HTTPException(status_code=401, detail="Invalid username or password")
     
     user_id, username, password_hash = db_user
-    if not ph.verify(password_hash, user.password):
+    try:
+        valid, new_hash = await hash_pool.verify(password_hash, user.password)
+    except HashPoolBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please try again later.")
+
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid username or password")
+
+    #argon2 parameters changed since the password was hashed, store the upgraded hash
+    if new_hash:
+        await asyncio.to_thread(update_password_hash, user_id, new_hash)
     
     token = create_token(user_id)
     print("User logged in:", user.username)
-    print("Generated token:", token)
     return {"token": token}
 
 
@@ -437,7 +541,7 @@ def create_vocab(chapter_id: int, authorization: str = Header(None), body: dict
         raise HTTPException(status_code=404, detail="Chapter not found")
 
     name = body.get("name")
-    data = json.dumps(body.get("data", {}))  # store as JSON string
+    data = serialize.dumps_str(body.get("data", {}))  # store as JSON string
 
     cur.execute(
         "INSERT INTO vocab (chapter_id, name, data) VALUES (?, ?, ?)",
@@ -485,7 +589,7 @@ def update_vocab(
         raise HTTPException(status_code=404, detail="Chapter not found or not owned by user")
 
     name = body.get("name")
-    data = json.dumps(body.get("data", {}))
+    data = serialize.dumps_str(body.get("data", {}))
 
     # Make sure vocab exists
     cur.execute("""
@@ -509,6 +613,171 @@ def update_vocab(
     return {"status": "updated", "id": vocab_id, "name": name}
 
 
+#splits a patch path into its steps
+#accepts the list paths collected by collect_to_be_translated, e.g. [entry, "senses", sense_id, "ko"]
+#as well as json pointer strings, e.g. "/12345/senses/1/ko"
+def parse_patch_path(path):
+    if isinstance(path, list):
+        return path
+
+    if isinstance(path, str):
+        if path == "":
+            return []
+        if not path.startswith("/"):
+            raise ValueError(f"Invalid path '{path}'")
+        return [p.replace("~1", "/").replace("~0", "~") for p in path[1:].split("/")]
+
+    raise ValueError(f"Invalid path '{path}'")
+
+
+#the key a path step stands for once stored, converted like the serializer converts non-string keys
+#(e.g. senses without a sense_index are stored under "null")
+def json_key(street):
+    if street is None:
+        return "null"
+    if isinstance(street, bool):
+        return "true" if street else "false"
+    return str(street)
+
+#resolves a single path step inside a dict or list
+def patch_step(curr, street, op):
+    if isinstance(curr, dict):
+        #json object keys are always strings once stored
+        return json_key(street)
+
+    if isinstance(curr, list):
+        #"-" addresses the end of a list (append)
+        if street == "-" and op == "add":
+            return len(curr)
+        try:
+            idx = int(street)
+        except (ValueError, TypeError):
+            raise ValueError(f"Invalid list index '{street}'")
+        if idx < 0 or idx > len(curr) or (idx == len(curr) and op != "add"):
+            raise ValueError(f"List index '{street}' out of range")
+        return idx
+
+    raise ValueError(f"Cannot descend into '{street}'")
+
+
+#applies json-patch style operations (add, replace, remove) to a vocab data blob in place
+def apply_vocab_patch(data, ops):
+    for op in ops:
+        if not isinstance(op, dict):
+            raise ValueError("Every operation must be an object")
+
+        kind = op.get("op")
+        if kind not in ("add", "replace", "remove"):
+            raise ValueError(f"Unsupported op '{kind}'")
+        if kind != "remove" and "value" not in op:
+            raise ValueError(f"Missing value for op '{kind}'")
+
+        path = parse_patch_path(op.get("path"))
+        if not path:
+            #whole document replacement, vocab data is always an object
+            if kind == "remove":
+                raise ValueError("Cannot remove the root")
+            if not isinstance(op["value"], dict):
+                raise ValueError("The root must stay an object")
+            data = op["value"]
+            continue
+
+        #walk along the path to the parent of the target element
+        curr = data
+        for street in path[: -1]:
+            key = patch_step(curr, street, "walk")
+            if isinstance(curr, dict) and key not in curr:
+                raise ValueError(f"Path {path} does not exist")
+            curr = curr[key]
+
+        key = patch_step(curr, path[-1], kind)
+
+        if isinstance(curr, dict):
+            if kind != "add" and key not in curr:
+                raise ValueError(f"Path {path} does not exist")
+            if kind == "remove":
+                del curr[key]
+            else:
+                curr[key] = op["value"]
+        else:
+            if kind == "add":
+                curr.insert(key, op["value"])
+            elif kind == "replace":
+                curr[key] = op["value"]
+            else:
+                del curr[key]
+
+    return data
+
+
+@app.patch("/chapters/{chapter_id}/vocab/{vocab_id}")
+def patch_vocab(
+    chapter_id: int,
+    vocab_id: int,
+    authorization: str = Header(None),
+    body: dict = Body(...)
+):
+    """
+    Partially update an existing vocab entry.
+    body should contain:
+    {
+        "name": "display name",  # optional
+        "ops": [
+            {"op": "replace", "path": [entry, "senses", sense_id, "ko"], "value": "..."},
+            {"op": "remove", "path": "/entry/senses/sense_id/ex/0"},
+            ...
+        ]
+    }
+    All operations are applied in one transaction, either all or none of them.
+    """
+    if authorization is None:
+        raise HTTPException(status_code=401, detail="Authorization header missing")
+
+    user_id = verify_user_token(authorization)
+
+    ops = body.get("ops", [])
+    if not isinstance(ops, list):
+        raise HTTPException(status_code=400, detail="ops must be a list")
+
+    conn = sqlite3.connect(DB_FILE)
+    cur = conn.cursor()
+
+    try:
+        #lock the db for writing, so no other update can slip in between read and write
+        cur.execute("BEGIN IMMEDIATE")
+
+        # Ensure vocab exists and belongs to user
+        cur.execute("""
+            SELECT v.data
+            FROM vocab v
+            JOIN chapters c ON v.chapter_id = c.id
+            JOIN collections co ON c.collection_id = co.id
+            WHERE v.id = ? AND v.chapter_id = ? AND co.user_id = ?
+        """, (vocab_id, chapter_id, user_id))
+        row = cur.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Vocab entry not found")
+
+        try:
+            data = apply_vocab_patch(serialize.loads(row[0]), ops)
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid patch: {e}")
+
+        name = body.get("name")
+        if name is None:
+            cur.execute("UPDATE vocab SET data = ? WHERE id = ?", (serialize.dumps_str(data), vocab_id))
+        else:
+            cur.execute("UPDATE vocab SET name = ?, data = ? WHERE id = ?", (name, serialize.dumps_str(data), vocab_id))
+
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return {"status": "patched", "id": vocab_id, "ops": len(ops)}
+
 
 @app.delete("/vocab/{vocab_id}")
 def delete_vocab(
@@ -574,14 +843,315 @@ def get_vocab_data(chapter_id: int, vocab_id: int, authorization: str = Header(N
     if not vocab:
         raise HTTPException(status_code=404, detail="Vocab not found")
 
-    vocab_dict = {
+    #the stored json blob is spliced in as is, so data arrives as an object without being decoded and re-encoded here
+    body = serialize.dumps({
         "id": vocab[0],
         "chapter_id": vocab[1],
         "name": vocab[2],
-        "data": vocab[3],  # JSON blob as string
         "created_at": vocab[4],
-    }
-    return vocab_dict
+    })
+    return Response(content=body[:-1] + b',"data":' + vocab[3].encode("utf-8") + b'}', media_type="application/json")
+
+
+
+#############Bulk import/export##############
+
+#rows are inserted in batches of this size during imports
+IMPORT_BATCH_SIZE = 1000
+
+#imports larger than this are staged on disk instead of in memory
+IMPORT_SPOOL_SIZE = 8 * 2**20
+
+#imports larger than this (in bytes) are rejected
+IMPORT_MAX_SIZE = int(os.environ.get("VOCABDICT_IMPORT_MAX_SIZE", 256 * 2**20))
+
+#yields the non-empty lines of an ndjson request body, without loading the whole body into memory
+#only new chunks are searched for line ends, the pieces of a line are joined once it is complete
+#raises a 413 once the body exceeds max_size
+async def iter_ndjson(request: Request, max_size=None):
+    max_size = IMPORT_MAX_SIZE if max_size is None else max_size
+    too_large = HTTPException(status_code=413, detail=f"Import larger than {max_size} bytes")
+    if int(request.headers.get("content-length") or 0) > max_size:
+        raise too_large
+
+    pieces = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_size:
+            raise too_large
+
+        start = 0
+        while (end := chunk.find(b"\n", start)) != -1:
+            pieces.append(chunk[start:end])
+            line = b"".join(pieces)
+            pieces = []
+            if line.strip():
+                yield line
+            start = end + 1
+        if start < len(chunk):
+            pieces.append(chunk[start:])
+
+    line = b"".join(pieces)
+    if line.strip():
+        yield line
+
+#streams the result rows of query as ndjson, formatting every row with to_line
+#the vocab data column is already json, so it is written out as is instead of being parsed and re-encoded
+def stream_ndjson(query, params, to_line):
+    #the generator is advanced from the threadpool, possibly from different threads
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+    try:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(IMPORT_BATCH_SIZE)
+            if not rows:
+                break
+            yield "".join(to_line(row) for row in rows)
+    finally:
+        conn.close()
+
+def vocab_line(name, data, chapter=None):
+    line = '{"name": ' + json.dumps(name, ensure_ascii=False) + ', "data": ' + data + '}'
+    if chapter is not None:
+        line = '{"chapter": ' + json.dumps(chapter, ensure_ascii=False) + ', ' + line[1:]
+    return line + "\n"
+
+#parses one import line into a dict, raising a 400 naming the line if it is not a valid import object
+#name is required unless allow_bare (a bare {"chapter": ...} line of a collection import)
+def parse_import_line(line, line_no, allow_bare=False):
+    try:
+        item = serialize.loads(line)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON on line {line_no}")
+    if not isinstance(item, dict):
+        raise HTTPException(status_code=400, detail=f"Line {line_no} is not an object")
+
+    if allow_bare and "data" not in item and "name" not in item:
+        return item
+    if not isinstance(item.get("name"), str) or not item["name"]:
+        raise HTTPException(status_code=400, detail=f"Missing name on line {line_no}")
+    if not isinstance(item.get("data", {}), dict):
+        raise HTTPException(status_code=400, detail=f"Data on line {line_no} is not an object")
+    return item
+
+#reads and validates the whole ndjson request body before anything is written, so a slow upload never holds
+#the database write lock; the validated lines are staged in a temporary file (in memory while small)
+#parse(line, line_no) returns the row to stage, returns the staged file and its number of lines
+async def stage_import(request: Request, parse):
+    staged = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE)
+    count = 0
+    try:
+        async for line in iter_ndjson(request):
+            count += 1
+            staged.write(serialize.dumps(parse(line, count)) + b"\n")
+    except BaseException:
+        staged.close()
+        raise
+    staged.seek(0)
+    return staged, count
+
+#yields the staged rows in batches
+def staged_batches(staged):
+    batch = []
+    for line in staged:
+        batch.append(serialize.loads(line))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    yield batch
+
+#returns whether the chapter exists and belongs to the user
+def owns_chapter(cur, chapter_id, user_id):
+    cur.execute("""
+        SELECT c.id
+        FROM chapters c
+        JOIN collections co ON c.collection_id = co.id
+        WHERE c.id = ? AND co.user_id = ?
+    """, (chapter_id, user_id))
+    return cur.fetchone() is not None
+
+def owns_collection(cur, collection_id, user_id):
+    cur.execute("SELECT id FROM collections WHERE id = ? AND user_id = ?", (collection_id, user_id))
+    return cur.fetchone() is not None
+
+#checks ownership with a connection of its own, from the threadpool
+def check_owner(owns, object_id, user_id):
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        return owns(conn.cursor(), object_id, user_id)
+    finally:
+        conn.close()
+
+#writes the staged rows of a chapter import in one transaction, returns the number of vocab imported
+def write_chapter_import(chapter_id, user_id, staged):
+    conn = sqlite3.connect(DB_FILE)
+    cur = conn.cursor()
+
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+
+        #the chapter may have been deleted while the body was uploaded
+        if not owns_chapter(cur, chapter_id, user_id):
+            raise HTTPException(status_code=404, detail="Chapter not found")
+
+        imported = 0
+        for batch in staged_batches(staged):
+            cur.executemany("INSERT INTO vocab (chapter_id, name, data) VALUES (?, ?, ?)",
+                            [(chapter_id, name, data) for name, data in batch])
+            imported += len(batch)
+
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return imported
+
+@app.get("/chapters/{chapter_id}/export")
+def export_chapter(chapter_id: int, authorization: str = Header(None)):
+    """
+    Streams all vocab of a chapter as ndjson, one {"name": ..., "data": {...}} object per line.
+    """
+    user_id = verify_user_token(authorization)
+
+    if not check_owner(owns_chapter, chapter_id, user_id):
+        raise HTTPException(status_code=404, detail="Chapter not found")
+
+    return StreamingResponse(
+        stream_ndjson(
+            "SELECT name, data FROM vocab WHERE chapter_id = ? ORDER BY id",
+            (chapter_id,),
+            lambda row: vocab_line(row[0], row[1]),
+        ),
+        media_type="application/x-ndjson",
+    )
+
+@app.post("/chapters/{chapter_id}/import")
+async def import_chapter(chapter_id: int, request: Request, authorization: str = Header(None)):
+    """
+    Imports ndjson vocab into a chapter, one {"name": ..., "data": {...}} object per line.
+    Everything is written in one transaction, so a broken line imports nothing.
+    """
+    user_id = await asyncio.to_thread(verify_user_token, authorization)
+
+    if not await asyncio.to_thread(check_owner, owns_chapter, chapter_id, user_id):
+        raise HTTPException(status_code=404, detail="Chapter not found")
+
+    def parse(line, line_no):
+        item = parse_import_line(line, line_no)
+        return [item["name"], serialize.dumps_str(item.get("data", {}))]
+
+    staged, _ = await stage_import(request, parse)
+    with staged:
+        imported = await asyncio.to_thread(write_chapter_import, chapter_id, user_id, staged)
+
+    return {"status": "imported", "id": chapter_id, "count": imported}
+
+@app.get("/collections/{collection_id}/export")
+def export_collection(collection_id: int, authorization: str = Header(None)):
+    """
+    Streams a whole collection as ndjson, one {"chapter": ..., "name": ..., "data": {...}} object per line.
+    Empty chapters are exported as a bare {"chapter": ...} line.
+    """
+    user_id = verify_user_token(authorization)
+
+    if not check_owner(owns_collection, collection_id, user_id):
+        raise HTTPException(status_code=404, detail="Collection not found")
+
+    def to_line(row):
+        chapter, name, data = row
+        if data is None:
+            return '{"chapter": ' + json.dumps(chapter, ensure_ascii=False) + '}\n'
+        return vocab_line(name, data, chapter)
+
+    return StreamingResponse(
+        stream_ndjson(
+            """
+            SELECT c.name, v.name, v.data
+            FROM chapters c
+            LEFT JOIN vocab v ON v.chapter_id = c.id
+            WHERE c.collection_id = ?
+            ORDER BY c.id, v.id
+            """,
+            (collection_id,),
+            to_line,
+        ),
+        media_type="application/x-ndjson",
+    )
+
+#writes the staged rows of a collection import in one transaction, returns the number of vocab imported and chapters created
+def write_collection_import(collection_id, user_id, staged):
+    conn = sqlite3.connect(DB_FILE)
+    cur = conn.cursor()
+
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+
+        #the collection may have been deleted while the body was uploaded
+        if not owns_collection(cur, collection_id, user_id):
+            raise HTTPException(status_code=404, detail="Collection not found")
+
+        #chapter name -> id, for chapters already in the collection
+        cur.execute("SELECT name, id FROM chapters WHERE collection_id = ? ORDER BY id DESC", (collection_id,))
+        chapters = dict(cur.fetchall())
+        created = 0
+        imported = 0
+
+        for batch in staged_batches(staged):
+            rows = []
+            for chapter, name, data in batch:
+                if chapter not in chapters:
+                    cur.execute("INSERT INTO chapters (collection_id, name) VALUES (?, ?)", (collection_id, chapter))
+                    chapters[chapter] = cur.lastrowid
+                    created += 1
+
+                #bare chapter line, nothing to insert
+                if name is not None:
+                    rows.append((chapters[chapter], name, data))
+
+            cur.executemany("INSERT INTO vocab (chapter_id, name, data) VALUES (?, ?, ?)", rows)
+            imported += len(rows)
+
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return imported, created
+
+@app.post("/collections/{collection_id}/import")
+async def import_collection(collection_id: int, request: Request, authorization: str = Header(None)):
+    """
+    Imports ndjson vocab into a collection, one {"chapter": ..., "name": ..., "data": {...}} object per line.
+    Vocab is added to the existing chapter of the same name, missing chapters are created.
+    Everything is written in one transaction, so a broken line imports nothing.
+    """
+    user_id = await asyncio.to_thread(verify_user_token, authorization)
+
+    if not await asyncio.to_thread(check_owner, owns_collection, collection_id, user_id):
+        raise HTTPException(status_code=404, detail="Collection not found")
+
+    def parse(line, line_no):
+        item = parse_import_line(line, line_no, allow_bare=True)
+        chapter = item.get("chapter")
+        if not isinstance(chapter, str) or not chapter:
+            raise HTTPException(status_code=400, detail=f"Missing chapter on line {line_no}")
+        if "name" not in item:
+            return [chapter, None, None]
+        return [chapter, item["name"], serialize.dumps_str(item.get("data", {}))]
+
+    staged, _ = await stage_import(request, parse)
+    with staged:
+        imported, created = await asyncio.to_thread(write_collection_import, collection_id, user_id, staged)
+
+    return {"status": "imported", "id": collection_id, "count": imported, "chapters_created": created}
+
 
 
 
@@ -592,167 +1162,186 @@ def get_vocab_data(chapter_id: int, vocab_id: int, authorization: str = Header(N
 
 #############Query stuff##############
 
+#returns the offsets of all entries of word, including the entries of its lemma if word is an inflected form
+def lookup_offsets(word, lang, cur):
+    try:
+        #headword entries and lemma entries of inflected forms in one query
+        cur.execute(f"SELECT offset FROM {lang}_offsets WHERE word = ? UNION SELECT offset FROM {lang}_forms WHERE form = ?", (word, word))
+    except sqlite3.OperationalError:
+        #index built before forms were indexed
+        cur.execute(f"SELECT offset FROM {lang}_offsets WHERE word = ?", (word,))
+    return cur.fetchall()
+
+#returns the dump file of lang and the offsets of word in it, read in one transaction,
+#so an index refresh swapped in concurrently is seen either completely or not at all
+def lookup_entries(word, lang, cur, lookup=lookup_offsets):
+    own_transaction = not cur.connection.in_transaction
+    if own_transaction:
+        cur.execute("BEGIN")
+    try:
+        return dict_path(lang, cur), lookup(word, lang, cur)
+    finally:
+        if own_transaction:
+            cur.execute("COMMIT")
+
+#raised inside the query stages once the query was cancelled, e.g. because the client disconnected
+class QueryCancelled(Exception):
+    pass
+
+#the query stages run in threads, they check the cancel event (a threading.Event, or None) between entries and batches
+def check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise QueryCancelled()
+
 #returns data from all entries of a word
-def fetch(word, lang, target_lang, cur, debug = False):
+def fetch(word, lang, target_lang, cur, debug = False, stats = None):
+    return fetch_targets(word, lang, [target_lang], cur, debug, stats)[target_lang]
 
-    #fetch all entries of <word> from db
-    cur.execute(f"SELECT offset FROM " + lang + "_offsets WHERE word =?", (word,))
+#returns data from all entries of a word for several target languages, as a dict target_lang -> result
+#entries are read, parsed and checked against the english pivot only once for all of them
+def fetch_targets(word, lang, target_langs, cur, debug = False, stats = None, cancel = None):
 
-    #get all line offsets of actual jsonl file
-    lines = cur.fetchall()
+    #collects stage timings and counters, discarded if the caller does not pass its own
+    stats = stats or metrics.QueryStats()
+
+    with stats.stage("sql"):
+        #get the jsonl file and all line offsets in it
+        dict_file, lines = lookup_entries(word, lang, cur)
     
-    #object to be returned later
-    ret = {}
+    #objects to be returned later, one per target language
+    rets = {target_lang: {} for target_lang in target_langs}
 
-    #open appropriate language file
-    with open(path.replace('*', lang), 'rb') as f:
+    #open appropriate language file, plain or compressed
+    with dictfile.open_dict(dict_file) as f:
 
         #for every offset matching our query
         for _i in tqdm(lines, desc=f"Querying {word} in {lang} dictionary..."):
 
+            check_cancelled(cancel)
+
             #unpack _i, as it is a tuple with 1 entry
             entry_id = _i[0]
 
-            #reset pointer to start of file
-            f.seek(0)
+            with stats.stage("file_read"):
+                #go to offset and read
+                line = f.read_line(entry_id)
 
-            #go to offset and read
-            f.seek(entry_id)
-            line = f.readline()
+            with stats.stage("json_parse"):
+                #load as json and decode from binary
+                entry = serialize.loads(line)
 
-            #load as json and decode from binary
-            entry = json.loads(line.decode("utf-8"))
+            stats.count("entries_read")
             
             #if the entries language is not german, skip
             if entry.get('lang_code') != lang:
                 continue
 
-            #create empty dict from this entry
-            ret[entry_id] = {}
-
             if debug:
                 print(entry.keys())
                 print(entry)
 
-            #original word
-            #TODO handle things like articles ("der", "die", "das") in german and capitalization in english
-            ret[entry_id]['word'] = entry.get('word')
-
-            #word type/position
-            ret[entry_id]['type'] = entry.get('pos')
-            
-            #iterate over all senses
-            senses = entry.get('senses', [])
-            ret[entry_id]['senses'] = {}
-
-            for j, sense in enumerate(senses):
-
-                id = sense.get('sense_index')
-
-                #initialize empty dict
-                ret[entry_id]['senses'][id] = {}
-
-                #iterate over all glosses and add to return
-                glosses = sense.get('glosses', [])
-                for gloss in glosses:
-                    ret[entry_id]['senses'][id][lang] = gloss
-
-                    #get translation
-                    ret[entry_id]['senses'][id][target_lang] = gloss
-                
-                #get raw tags as simple categories, if they exist (rare)
-                ret[entry_id]['senses'][id]['tags'] = sense.get('raw_tags', [])
-
-                #get example sentences
-                ret[entry_id]['senses'][id].setdefault('ex', {})
+            #word, type, senses and examples of this entry
+            for target_lang, ret in rets.items():
+                ret[entry_id] = parse_entry(entry, lang, target_lang)
 
-                for k, example in enumerate(sense.get('examples', [])):
-                    ret[entry_id]['senses'][id]['ex'].setdefault(k, {})[lang] = example.get('text')
-                
-                    #translate to target_lang as well
-                    ret[entry_id]['senses'][id]['ex'].setdefault(k, {})[target_lang] = example.get('text')
-                
-            #initialize translation dicts:
-            #for sense in ret[i]['senses']:
-            #    ret[i]['senses'][sense][f'{lang}_tl'] = []
-            #    ret[i]['senses'][sense]['en_tl'] = []
+            #glosses are the same for all target languages
+            senses = next(iter(rets.values()))[entry_id]['senses']
 
             #get translations
             translations = entry.get('translations', [])
              
             #init dicts for translations
-            tl_dict = {}
-            tl_dict[target_lang] = {}
-            
-            #fallback, as many words might not have a direct translation to target_lang
-            tl_dict['en'] = {}
+            #english is always collected, as a fallback, as many words might not have a direct translation to target_lang
+            tl_dict = {target: {} for target in (*target_langs, 'en')}
             
+            #english pivot candidates of this entry, as (sense_id, translation) pairs per target language
+            pivots = {target_lang: [] for target_lang in target_langs}
+
+            #en_lookup results per english word, as the same word is often listed for several senses
+            en_results = {}
 
             for tl in translations:
 
                 sense_id = tl.get('sense_index')
 
-                #always get english translations as well
-                for target in (target_lang, 'en'):
-
-                    #check, if the translation matches our language and only add new translations, no duplicates
-                    if tl.get('lang_code') == target and tl.get('word') not in tl_dict[target].get(sense_id, []):
-                    
-                        tl_dict[target].setdefault(sense_id, []).append(tl.get('word'))
+                #check, if the translation matches one of our languages and only add new translations, no duplicates
+                target = tl.get('lang_code')
+                if target in tl_dict and tl.get('word') not in tl_dict[target].get(sense_id, []):
+                    tl_dict[target].setdefault(sense_id, []).append(tl.get('word'))
 
                 
                 #get target language translations over english as well, as many words in german dont have korean translations
                 if tl.get('lang_code') == 'en':
 
-                    en_results = en_lookup(tl.get('word'), target_lang, ret[entry_id]['senses'][sense_id][lang], cur)
-                    for result in en_results:
-
-                        #check, whether the translation matches the original sense
-                        scores = similarity_check([[ret[entry_id]['word'], ret[entry_id]['senses'][sense_id][lang], result]], [ret[entry_id]['senses'][sense_id][lang]])
-
-
-                        if scores[0][1] < 0.3: #sense similarity threshold
-                            print(f"Refused '{result}' as translation for sense '{ret[entry_id]['senses'][sense_id][lang]}' with score {scores[0][1]}")
-                            continue
-
-                        if result not in tl_dict[target_lang].get(sense_id, []) and result is not None:
+                    #skip translations for senses without a gloss to compare against
+                    sense = senses.get(sense_id)
+                    if sense is None or sense.get(lang) is None:
+                        continue
+
+                    en_word = tl.get('word')
+                    if en_word not in en_results:
+                        check_cancelled(cancel)
+                        with stats.stage("en_lookup"):
+                            en_results[en_word] = en_lookup(en_word, target_langs, cur)
+                        stats.count("pivot_lookups")
+
+                    for target_lang, results in en_results[en_word].items():
+                        for result in results:
+                            if result is not None:
+                                pivots[target_lang].append((sense_id, result))
+
+            #check, whether the pivot translations match the original senses, all at once for all target languages
+            all_pivots = list(dict.fromkeys(pivot for target_pivots in pivots.values() for pivot in target_pivots))
+            if all_pivots:
+                check_cancelled(cancel)
+                glosses = {sense_id: senses[sense_id][lang] for sense_id, _ in all_pivots}
+                with stats.stage("similarity"):
+                    accepted = set(filter_pivots(all_pivots, glosses))
+                stats.count("embeddings_computed", len(glosses) + len(set(candidate for _, candidate in all_pivots)))
+
+                for target_lang, target_pivots in pivots.items():
+                    for sense_id, result in target_pivots:
+                        if (sense_id, result) in accepted and result not in tl_dict[target_lang].get(sense_id, []):
                             tl_dict[target_lang].setdefault(sense_id, []).append(result)
 
 
-            #add translations to return dict
-            for sense in ret[entry_id]['senses']:
-                ret[entry_id]['senses'][sense][f'{target_lang}_tl'] = tl_dict[target_lang].get(sense, [])
-                ret[entry_id]['senses'][sense]['en_tl'] = tl_dict['en'].get(sense, [])
-    return ret
+            #add translations to return dicts
+            #every result gets its own lists, as append_add_keys later appends to them per result
+            for target_lang, ret in rets.items():
+                for sense in ret[entry_id]['senses']:
+                    ret[entry_id]['senses'][sense][f'{target_lang}_tl'] = list(tl_dict[target_lang].get(sense, []))
+                    ret[entry_id]['senses'][sense]['en_tl'] = list(tl_dict['en'].get(sense, []))
+    return rets
+
 
 
+#returns the offsets of the english headword entries of word
+def en_headword_offsets(word, lang, cur):
+    cur.execute("SELECT offset FROM en_offsets WHERE word=?", (word,))
+    return cur.fetchall()
 
-#takes the english translation and returns the word in target_language, by going through the english dictionary
-def en_lookup(word, target_lang, sense, cur):
+#takes the english translation and returns the words in every target language, by going through the english dictionary
+#as a dict target_lang -> translations
+def en_lookup(word, target_langs, cur):
     
     #get offsets of entries about word
-    cur.execute("SELECT offset FROM en_offsets WHERE word=?", (word,))
+    dict_file, lines = lookup_entries(word, 'en', cur, lookup=en_headword_offsets)
 
-    lines = cur.fetchall()
+    #lists containing all translations to be returned
+    ret = {target_lang: [] for target_lang in target_langs}
 
-    #open dict file
-    with open('./wiktionary/en_dict.jsonl', 'rb') as f:
-        
-        #list containing all translations to be returned
-        ret = []
+    #open dict file, plain or compressed
+    with dictfile.open_dict(dict_file) as f:
 
         for _i in lines:
             #unpack tuple to get int byte offset
             i = _i[0]
 
             #jump to byte offset and read line
-            f.seek(0)
-            f.seek(i)
-
-            line = f.readline()
+            line = f.read_line(i)
 
             #convert line to json obj(entry)
-            entry = json.loads(line.decode("utf-8"))
+            entry = serialize.loads(line)
             
 
             #skip non-english entries
@@ -763,263 +1352,169 @@ def en_lookup(word, target_lang, sense, cur):
             translations = entry.get('translations', [])
             
 
-            #iterate over all translations and pick ones matching our target_lang
+            #iterate over all translations and pick ones matching our target languages
             for tl in translations:
-                if tl.get('code') == target_lang:
-                    #skip duplicates
-                    if tl.get('word') not in ret:
-                        ret.append(tl.get('word'))
+                target = ret.get(tl.get('code'))
+                #skip duplicates
+                if target is not None and tl.get('word') not in target:
+                    target.append(tl.get('word'))
 
         return ret
 
 
 
-#pretty json printer by wrapping json.dumps()
+#pretty json printer, for debug output
 def pprint(j):
-    print(json.dumps(j, indent=2, ensure_ascii=False))
-
+    print(serialize.pretty(j))
+
+
+#strings per model call in a query, the query can be cancelled between them
+TRANSLATE_BATCH = int(os.environ.get("VOCABDICT_TRANSLATE_BATCH", 32))
+
+#translates the list of strings in batches, checking for cancellation in between
+#returns the translations and, per translation, the model that produced it (see translators.model_key)
+#a batch the model did not return exactly one translation per string for is dropped as a whole (None),
+#as its translations cannot be matched to their strings
+def translate_batched(words, lang, target_lang, tl_model, cancel = None):
+    translated = []
+    models = []
+    for i in range(0, len(words), TRANSLATE_BATCH):
+        check_cancelled(cancel)
+        batch = words[i: i + TRANSLATE_BATCH]
+        result, model = translate_with_model(batch, lang, target_lang, tl_model)
+        if not isinstance(result, list) or len(result) != len(batch):
+            print(f"{tl_model} returned {len(result) if isinstance(result, list) else 'no'} translations "
+                  f"for {len(batch)} strings, leaving them untranslated")
+            result = [None] * len(batch)
+        translated += result
+        models += [model] * len(batch)
+    return translated, models
+
+#translates the list of strings, taking translations from the translation store (see pretranslate.py) where it has them
+#new translations are added to the store under the model that produced them, so a model translates every string
+#only once per language pair; strings left without a translation keep their original text
+def translate_stored(words, lang, target_lang, tl_model, stats = None, cancel = None):
+    stats = stats or metrics.QueryStats()
 
-def collect_to_be_translated(dict, lang, target_lang):
-    #object containing everything that needs to be translated
-    to_be_translated = []
-    origin = []
-
-    #Iterate through all different entries associated with the original word
-    for entry in dict.keys():
-
-        #skip original word entry
-        if entry == lang:
-            continue
-
-        #Iterate through all senses of the entry
-        for sense_id in dict[entry]['senses'].keys():
-            
-            for content in dict[entry]['senses'][sense_id]:
-                #definitions in target lang
-                if content == target_lang:
-
-                    to_be_translated.append(dict[entry]['senses'][sense_id][content])
-                    origin.append([entry, "senses", sense_id, content])
-                
-                #example sentences in target lang
-                if content == 'ex':
-                    for idx in dict[entry]['senses'][sense_id][content].keys():
-                            to_be_translated.append(dict[entry]['senses'][sense_id][content][idx][target_lang])
-                            origin.append([entry, "senses", sense_id, content, idx, target_lang])
-        
-
-    return to_be_translated, origin
-
-
-
-
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
-import torch
-
-lang_code_map = {
-    "de": "deu_Latn",  # German
-    "ko": "kor_Hang",  # Korean
-    "en": "eng_Latn",  # English
-    "fr": "fra_Latn",  # French
-    "es": "spa_Latn",  # Spanish
-    # add more as needed
-}
-
-#translates the list of words from lang to target_lang using NLLB distilled model
-def nllb_translate(words, lang, target_lang):
-
-    if not words:
-        print("No words to translate.")
-        return []
-
-    #Check for unsupported language codes (to be added as needed)
-    if lang not in lang_code_map or target_lang not in lang_code_map:
-        raise ValueError(f"Unsupported lang code. Supported: {list(lang_code_map.keys())}")
-    
-    #get appropriate src and tgt codes from lang_code_map
-    src = lang_code_map[lang]
-    tgt = lang_code_map[target_lang]
-
-    #load model and tokenizer
-    model_name = "facebook/nllb-200-distilled-600M"
-    tokenizer = AutoTokenizer.from_pretrained(model_name, src_lang=src, tgt_lang=tgt)
-    model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
-    model.to('cuda' if torch.cuda.is_available() else 'cpu')
-
-    #tokenize and translate
-    inputs = tokenizer(words, return_tensors="pt", padding=True, truncation=True).to(model.device)
-    translated = model.generate(**inputs, forced_bos_token_id=tokenizer.convert_tokens_to_ids(tgt))
-
-    return tokenizer.batch_decode(translated, skip_special_tokens=True)
-
-
-import requests
-
-openrouter_api_key = load_OR_key(path="OR_key.txt")
-openrouter_url = "https://openrouter.ai/api/v1/chat/completions"
-model_id = "deepseek/deepseek-r1:free"  
-
-
-#translates the list of strings using deepseek
-def deepseek_translate(words, lang, target_lang):
     if not words:
-        print("No words to translate.")
         return []
-     
-    headers = {
-        "Authorization": f"Bearer {openrouter_api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "http://localhost",
-        "User-Agent": "VocabDict/1.0 (luisdrayer@web.de)"
-    }
-
-    system_role = "You are a translation tool."
-
-    prompt = {
-        "role": "user",
-        "content": (
-            f"Translate the following {lang} sentences into {target_lang}. "
-            f"Return the result strictly as a JSON object with keys 'original' and 'translation' "
-            f"for each sentence, like:\n"
-            f"[{{'original': '...', 'translation': '...'}}, ...]\n\n"
-            f"Sentences:\n{words}"
-        )
-    }
 
-    payload = {
-        "model": model_id,
-        "messages": [
-            {"role": "system", "content": system_role},
-            prompt,
-        ],
-    }
-
-    #try to query deepseek, if it fails (e.g. rate limit), use nllb as backup
+    conn = translation_store.connect() if translation_store.enabled() else None
     try:
-        resp = requests.post(openrouter_url, headers=headers, json=payload)
-        resp.raise_for_status()
-        content_str = resp.json()["choices"][0]["message"]["content"]
-    
-        resp = requests.post(openrouter_url, headers=headers, json=payload)
-        resp.raise_for_status()
-        content_str = resp.json()["choices"][0]["message"]["content"]
-        # parse JSON safely
-        try:
-            content_list = json.loads(content_str.replace("'", '"'))
-            return [item["translation"] for item in content_list]
-        except json.JSONDecodeError:
-            print("DeepSeek returned invalid JSON, falling back to backup translator.")
-            return nllb_translate(words, lang, target_lang)
-
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 429:
-            print("DeepSeek rate-limited (429). Using backup translator...")
-            return nllb_translate(words, lang, target_lang)
-
-
-# load the DeepL api key
-def load_DeepL_key(path="DeepL_key.txt"):
-    with open(path, "r") as f:
-        return f.read().strip()
-
-DeepL_api_key = load_DeepL_key()
-DeepL_url = "https://api-free.deepl.com/v2/translate"
-
-#translates the list of strings using DeepL
-def deepl_translate(words, lang, target_lang):
-    if not words:
-        print("No words to translate.")
-        return []
-    
-    headers = {
-        "Authorization": f"DeepL-Auth-Key {DeepL_api_key}"
-    }
-
-    # DeepL requires multiple 'text' fields for multiple sentences
-    data = [("text", w) for w in words]  # list of tuples
-    data += [
-        ("source_lang", lang),
-        ("target_lang", target_lang)
-    ]
-
-    resp = requests.post(DeepL_url, headers=headers, data=data)
-    resp.raise_for_status()
-    #pprint(resp.json())
-    return [t["text"] for t in resp.json()["translations"]]
-
-
+        stored = {}
+        if conn:
+            stored = translation_store.lookup(conn, lang, target_lang, model_key(tl_model), words)
+            stats.count("translations_from_store", len(stored))
+        missing = [w for w in words if w not in stored]
+
+        if missing:
+            translated, models = translate_batched(missing, lang, target_lang, tl_model, cancel)
+            if conn:
+                for model in set(models):
+                    translation_store.store(conn, lang, target_lang, model, [
+                        (w, t) for w, t, m in zip(missing, translated, models)
+                        if m == model and isinstance(w, str) and isinstance(t, str)
+                    ])
+                conn.commit()
+            stored.update((w, t) for w, t in zip(missing, translated) if t is not None)
+    finally:
+        if conn:
+            conn.close()
+
+    return [stored.get(w, w) for w in words]
 
 
 #reinserts the translated elements back into the original dict
+#origins[idx] holds every path the string translated[idx] was collected from
 def insert_translations(translated, origins, dict, lang, target_lang):
     #iterate through all origins and insert the corresponding translation
-    for idx, path in enumerate(origins):
+    for idx, paths in enumerate(origins):
+        for path in paths:
 
-        #start from root of dict
-        curr = dict
+            #start from root of dict
+            curr = dict
 
-        #walk along the path to the target element
-        for street in path[: -1]:
-            curr = curr[street]
-        
-        #we have arrived at our target element
-        #replace the target element with the translation
-        curr[path[-1]] = translated[idx]
+            #walk along the path to the target element
+            for street in path[: -1]:
+                curr = curr[street]
+            
+            #we have arrived at our target element
+            #replace the target element with the translation
+            curr[path[-1]] = translated[idx]
 
     return dict
 
 
 
-from sentence_transformers import SentenceTransformer, util
-#embedding model for semantic similarity checks
+#the embedding model for semantic similarity checks is loaded on first use by inference.load_embedder,
+#with the backend selected by VOCABDICT_EMBED_BACKEND
 
-embedder = SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
+#sense similarity threshold for translations found over the english pivot
+PIVOT_THRESHOLD = 0.3
 
+#computes the cosine similarity of every candidate to every sense in one embedding batch
+#returns a len(candidates) x len(senses) numpy matrix
+def sense_similarity(senses, candidates):
+    if translators.worker_pool:
+        return translators.worker_pool.similarity(senses, candidates)
+    return inference.similarity_matrix(senses, candidates)
 
-#computes similarity scores between all sentence pairs in sentences, using sentence-transformers
-def similarity_check(pairs, senses):
 
-    #return object
-    cosine_scores = []
+#filters (sense_id, candidate) pivot pairs by the similarity of candidate and sense gloss
+#glosses maps every sense_id to its gloss, returns the accepted pairs without duplicates, in order
+def filter_pivots(pivots, glosses):
+    import numpy as np
 
-    #iterate over all pairs of original word and proposed translation
-    for i, pair in enumerate(pairs):
+    sense_ids = list(glosses)
+    candidates = list(dict.fromkeys(candidate for _, candidate in pivots))
 
-        #list containing all embeddings
-        embeddings = []
+    #candidate x sense similarity matrix
+    matrix = sense_similarity([glosses[s] for s in sense_ids], candidates)
 
-        #iterate over elements in pair (original word, translation)
-        for element in pair:
+    #pick the score of every pair from the matrix and apply the threshold
+    sense_idx = {s: i for i, s in enumerate(sense_ids)}
+    candidate_idx = {c: i for i, c in enumerate(candidates)}
+    rows = np.fromiter((candidate_idx[c] for _, c in pivots), dtype=np.intp, count=len(pivots))
+    cols = np.fromiter((sense_idx[s] for s, _ in pivots), dtype=np.intp, count=len(pivots))
+    scores = matrix[rows, cols]
+    mask = scores >= PIVOT_THRESHOLD
 
-            #Guard against empty elements
-            if element == None:
-                continue
-
-            #Compute embedding for both lists
-            embeddings.append(embedder.encode(element, convert_to_tensor=True))
-        
-        #also encode the original sense for comparison
-        embeddings.append(embedder.encode(senses[i], convert_to_tensor=True))
+    for i in np.flatnonzero(~mask):
+        sense_id, result = pivots[i]
+        print(f"Refused '{result}' as translation for sense '{glosses[sense_id]}' with score {scores[i]}")
 
+    return list(dict.fromkeys(pivot for pivot, keep in zip(pivots, mask) if keep))
 
-        #Compute cosine-similarities---------------------------------------------------
 
-        #compare original word to translation
-        translation_sim_score = util.pytorch_cos_sim(embeddings[0], embeddings[1])[0][0].item()
+#loads all models, so the first query does not have to wait for them
+def warmup_models():
+    if translators.worker_pool:
+        return translators.worker_pool.warmup()
+    return inference.warmup()
 
-        #compare translation to sense
-        sense_sim_score = util.pytorch_cos_sim(embeddings[1], embeddings[2])[0][0].item()
-
-        cosine_scores.append([translation_sim_score, sense_sim_score])
+#reports the outcome of the warm-up started on startup, which nobody awaits
+def log_warmup(task):
+    if task.cancelled():
+        print("Warm-up cancelled")
+    elif task.exception() is not None:
+        import traceback
+        print("Warm-up failed, models are loaded on first use instead")
+        traceback.print_exception(task.exception())
+    else:
+        print(f"Warmed up, load times {task.result()}")
 
-    return cosine_scores
+@app.post("/warmup")
+async def warmup(authorization: str = Header(None)):
+    verify_admin_token(authorization)
+    timings = await asyncio.to_thread(warmup_models)
+    return {"status": "ok", "load_seconds": timings, "rss_bytes": metrics.process_rss()}
 
 
 #checks the usage limit of the openrouter key
 @app.post("/check_deepseek_key")
 def check_openrouter_key():
     headers = {
-    "Authorization": f"Bearer {openrouter_api_key}",
+    "Authorization": f"Bearer {openrouter_api_key()}",
     "User-Agent": "VocabDict/1.0 (luisdrayer@web.de)"
     }
     resp = requests.get("https://openrouter.ai/api/v1/key", headers=headers)
@@ -1027,34 +1522,48 @@ def check_openrouter_key():
     return resp.json()
 
 
-def append_add_keys(obj, parent=None, key_in_parent=None):
-    if isinstance(obj, dict):
-        for k, v in list(obj.items()):
-            obj[k] = append_add_keys(v, obj, k)
+#adds "add" placeholders to a result dict in place, where the frontend offers to add custom content:
+#every list gets a trailing "add", empty dicts become {"add": {}},
+#and dicts holding dicts under int-like keys (entries, examples) get an "add" key
+#a single iterative pass, so large entries do not pay for recursion and rebuilding
+def append_add_keys(obj):
+    stack = [obj]
+    push = stack.append
+    pop = stack.pop
 
-        # If dict is empty, replace it with {"add": {}}
-        if not obj:  
-            obj["add"] = {}
-        
-        # If this dict itself lives under an int-like key -> put "add" on parent
-        if is_int_key(key_in_parent):
-            if isinstance(parent, dict):
-                parent["add"] = {}
+    while stack:
+        curr = pop()
 
-        return obj
-
-    elif isinstance(obj, list):
-        for i in range(len(obj)):
-            obj[i] = append_add_keys(obj[i], obj, i)
-        obj.append("add")
-        return obj
+        if isinstance(curr, dict):
+            # If dict is empty, replace it with {"add": {}}
+            if not curr:
+                curr["add"] = {}
+                continue
 
-    else:
-        return obj
+            has_int_child = False
+            for k, v in curr.items():
+                if isinstance(v, dict):
+                    push(v)
+                    if not has_int_child and is_int_key(k):
+                        has_int_child = True
+                elif isinstance(v, list):
+                    push(v)
+
+            # If a dict lives under an int-like key -> put "add" on its parent
+            if has_int_child:
+                curr["add"] = {}
+
+        elif isinstance(curr, list):
+            for v in curr:
+                if isinstance(v, (dict, list)):
+                    push(v)
+            curr.append("add")
+
+    return obj
     
 def is_int_key(key):
     """
-    Check if a given key can be parsed into an integer.
+    Check if a given key can be parsed into an integer, without trying to parse it.
 
     Parameters:
         key (any): The key to be checked.
@@ -1062,67 +1571,239 @@ def is_int_key(key):
     Returns:
         bool: True if the key can be parsed into an integer, False otherwise.
     """
-    try:
-        int(key)
+    if isinstance(key, int):
         return True
-    except (ValueError, TypeError):
+    if not isinstance(key, str):
         return False
+    if key.isdecimal():
+        return True
+
+    key = key.strip()
+    if key[:1] in ("+", "-"):
+        key = key[1:]
+    return key.isdecimal()
 
-#completely wipes a result dict, leaving only keys
+#completely wipes a result dict in place, leaving only keys
+#lists become empty lists and strings empty strings, numbers, bools and None stay unchanged
 def wipe(data):
-    if isinstance(data, dict):
-        return {k: wipe(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return []  # replace lists with empty list
-    elif isinstance(data, str):
-        return ""  # replace strings with empty string
-    else:
-        return data  # leave numbers, bools, None unchanged
+    if isinstance(data, list):
+        return []
+    if isinstance(data, str):
+        return ""
 
+    stack = [data] if isinstance(data, dict) else []
 
-@app.get("/get_empty_entry")
-#gets an empty entry to be used for custom input (by the user)
-def get_empty_entry(lang : str, target_lang : str):
-    with sqlite3.connect('./wiktionary/offsets.db') as db:
+    while stack:
+        curr = stack.pop()
+        for k, v in curr.items():
+            if isinstance(v, dict):
+                stack.append(v)
+            elif isinstance(v, list):
+                curr[k] = []  # replace lists with empty list
+            elif isinstance(v, str):
+                curr[k] = ""  # replace strings with empty string
+
+    return data
+
+
+#memory mapped autocomplete indices per language
+autocomplete_indices = {}
+
+#returns the autocomplete index of lang, reopening it if it was rebuilt, or None if there is none
+def get_autocomplete_index(lang):
+    _, _, meta_path = autocomplete.index_paths(lang)
+    if not os.path.exists(meta_path):
+        return None
+
+    index = autocomplete_indices.get(lang)
+    if index is None or index.mtime != os.path.getmtime(meta_path):
+        index = autocomplete_indices[lang] = autocomplete.AutocompleteIndex(lang)
+    return index
+
+@app.get("/autocomplete")
+#suggests headwords for a (partially typed) word, tolerating a typo
+def get_autocomplete(q: str, lang: str, limit: int = 10, fuzzy: bool = True):
+    if not lang.isalpha():
+        raise HTTPException(status_code=400, detail="Invalid language")
+
+    index = get_autocomplete_index(lang)
+    if index is None:
+        raise HTTPException(status_code=404, detail=f"No autocomplete index for '{lang}'")
+
+    with metrics.timed("vocabdict_autocomplete_seconds", lang=lang):
+        suggestions = index.complete(q, max(1, min(limit, 50)), fuzzy)
+    return {"query": q, "suggestions": suggestions}
+
+#number of empty entry templates kept, one per language pair (and index version)
+EMPTY_ENTRY_CACHE_SIZE = 64
+
+#language codes, optionally with a region as some translation apis use them, e.g. "ko", "en-GB"
+LANG_CODE = re.compile(r"[A-Za-z]{2,3}(-[A-Za-z]{2,4})?")
+
+#changes whenever the offsets index is rebuilt
+def index_version():
+    return os.path.getmtime(offsets_db)
+
+#the languages with an indexed dictionary, per index version
+@functools.lru_cache(maxsize=1)
+def indexed_languages(version):
+    with sqlite3.connect(offsets_db) as db:
+        rows = db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '%\\_offsets' ESCAPE '\\'").fetchall()
+    return frozenset(name[: -len("_offsets")] for name, in rows)
+
+#builds the empty entry template, a wiped copy of a real entry
+def build_empty_entry(lang, target_lang):
+    with sqlite3.connect(offsets_db) as db:
         cur = db.cursor()
 
         res = append_add_keys(wipe(fetch("herrje", lang, target_lang, cur)))
         val = list(res.values())[0]
-    return {"custom": val}
+    return serialize.dumps({"custom": val})
+
+#empty entry templates as encoded json, built once per language pair and index version
+@functools.lru_cache(maxsize=EMPTY_ENTRY_CACHE_SIZE)
+def empty_entry(lang, target_lang, version):
+    return build_empty_entry(lang, target_lang)
 
-async def run_query(ws: WebSocket, word, lang, target_lang, tl_model):
-    await ws.send_text(f"Querying for word: {word}")
+@app.get("/get_empty_entry")
+#gets an empty entry to be used for custom input (by the user)
+#the template only depends on the language pair, so it is built once and served from the cache
+#the source language needs a dictionary, the target language can be any language code (e.g. one only DeepL supports)
+def get_empty_entry(lang : str, target_lang : str):
+    version = index_version()
+    languages = indexed_languages(version)
+    if lang not in languages:
+        raise HTTPException(status_code=400, detail=f"No dictionary for '{lang}', available: {sorted(languages)}")
+    if not LANG_CODE.fullmatch(target_lang):
+        raise HTTPException(status_code=400, detail=f"Invalid target language '{target_lang}'")
+
+    return Response(content=empty_entry(lang, target_lang, version), media_type="application/json")
+
+#sends a progress message, as plain text or, if the client asked for stats, as json including the stats so far
+async def send_progress(ws: WebSocket, message, stats, send_stats):
+    if send_stats:
+        await send_json(ws, {"type": "progress", "message": message, "stats": stats.as_dict()})
+    else:
+        await ws.send_text(message)
+
+#sends msg as a json text frame, encoded once with the fast serializer
+async def send_json(ws: WebSocket, msg):
+    await ws.send_text(serialize.dumps_str(msg))
+
+#fetches the entries of word for all target languages, with a connection of the calling thread
+def fetch_word(word, lang, target_langs, debug = False, stats = None, cancel = None):
+    with sqlite3.connect(offsets_db) as db:
+        return fetch_targets(word, lang, target_langs, db.cursor(), debug=debug, stats=stats, cancel=cancel)
+
+#translates the collected strings of one target language's result, returns the translations and where they go
+def translate_result(result, lang, target_lang, tl_model, stats, cancel = None):
+    to_be_translated, origins = collect_to_be_translated(result, lang, target_lang)
+
+    with stats.stage("translate"):
+        translated = translate_stored(to_be_translated, lang, target_lang, tl_model, stats, cancel)
+    stats.count("sentences_translated", len(to_be_translated))
+    stats.count("sentences_deduplicated", sum(len(paths) for paths in origins) - len(to_be_translated))
+
+    return translated, origins
+
+#runs fn in a thread like asyncio.to_thread, recording the thread's future in threads
+#cancelling the caller does not stop the thread, the recorded futures tell when it actually returned
+async def query_thread(threads, fn, *args):
+    future = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+    threads.append(future)
+    return await asyncio.shield(future)
+
+#runs a query for one target language, or for a list of them
+#for a list, the entries are fetched once for all languages, and the result message holds one result per language
+#fetching and translating run in threads, so the event loop stays free; setting cancel stops them at the next entry or batch
+async def run_query(ws: WebSocket, word, lang, target_lang, tl_model, send_stats = False, debug = False, cancel = None, threads = None):
+    stats = metrics.QueryStats()
+    threads = [] if threads is None else threads
+    target_langs = target_lang if isinstance(target_lang, list) else [target_lang]
+
+    await send_progress(ws, f"Querying for word: {word}", stats, send_stats)
     word = word.lower()
 
-    with sqlite3.connect('./wiktionary/offsets.db') as db:
-        cur = db.cursor()
+    await send_progress(ws, "Fetching word data", stats, send_stats)
+    results = await query_thread(threads, fetch_word, word, lang, target_langs, debug, stats, cancel)
 
-        await ws.send_text("Fetching word data")
-        result1 = fetch(word, lang, target_lang, cur)
+    #the target languages are translated concurrently
+    await send_progress(ws, f"Translating entries using {tl_model} model", stats, send_stats)
+    translations = await asyncio.gather(*(
+        query_thread(threads, translate_result, results[tl], lang, tl, tl_model, stats, cancel) for tl in target_langs
+    ))
 
-        await ws.send_text(f"Translating entries using {tl_model} model")
-        to_be_translated, origins = collect_to_be_translated(result1, lang, target_lang)
-        translated = []
+    await send_progress(ws, "Inserting translations", stats, send_stats)
+    for tl, (translated, origins) in zip(target_langs, translations):
+        with stats.stage("insert_translations"):
+            insert_translations(translated, origins, results[tl], lang, tl)
+        with stats.stage("append_add_keys"):
+            append_add_keys(results[tl])
 
-        match tl_model:
-            case "NLLB":
-                translated = nllb_translate(to_be_translated, lang, target_lang)
-            case "Deepseek":
-                translated = deepseek_translate(to_be_translated, lang, target_lang)
-            case "DeepL":
-                translated = deepl_translate(to_be_translated, lang, target_lang)
+    if debug:
+        pprint(results)
 
-        await ws.send_text("Inserting translations")
-        result2 = insert_translations(translated, origins, result1, lang, target_lang)
-        append_add_keys(result2)
-        pprint(result2)
+    stats.publish(tl_model=tl_model)
 
-    await ws.send_json({"type": "result", "data": result2})
+    if isinstance(target_lang, list):
+        msg = {"type": "results", "data": results}
+    else:
+        msg = {"type": "result", "data": results[target_lang]}
+
+    if send_stats:
+        msg["stats"] = stats.as_dict()
+    await send_json(ws, msg)
+
+#limits the number of queries running at once, per server process
+query_admission = admission.Admission()
+
+metrics.describe("vocabdict_queries_cancelled_total", "Queries cancelled because the client disconnected")
+
+#the user a query counts against for the per-user limit: the user of the optional token, otherwise the client address
+def query_user(ws: WebSocket, data):
+    token = data.get("token")
+    user_id = decode_jwt(token) if isinstance(token, str) else None
+    if user_id is not None:
+        return f"user:{user_id}"
+    client = getattr(ws, "client", None)
+    if not client:
+        return "unknown"
+    headers = getattr(ws, "headers", None) or {}
+    return f"host:{admission.client_address(client.host, headers.get('x-forwarded-for'))}"
+
+#returns once the client disconnected, other messages from the client are ignored
+async def wait_for_disconnect(ws: WebSocket):
+    while True:
+        message = await ws.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+#waits for admission, telling the client its queue position, then runs the query
+async def admitted_query(ws: WebSocket, user, word, lang, target_lang, tl_model, send_stats, debug, cancel):
+    async def on_position(position):
+        await send_progress(ws, f"Waiting in queue, position {position}", metrics.QueryStats(), send_stats)
+
+    await query_admission.acquire(user, on_position)
+    threads = []
+    try:
+        await run_query(ws, word, lang, target_lang, tl_model, send_stats, debug, cancel, threads)
+    finally:
+        #a cancelled query's threads keep running until their next check of cancel,
+        #the slot is only free once they returned, so cancelled queries never exceed the limit
+        try:
+            if threads:
+                if cancel is not None:
+                    cancel.set()
+                await asyncio.gather(*threads, return_exceptions=True)
+        finally:
+            query_admission.release(user)
 
 @app.websocket("/ws/query")
 async def query_ws(ws: WebSocket):
     await ws.accept()
     task = None
+    watcher = None
+    cancel = None
 
     try:
         data = await ws.receive_json()
@@ -1131,17 +1812,61 @@ async def query_ws(ws: WebSocket):
         target_lang = data["target_lang"]
         tl_model = data["tl_model"]
 
-        # Run the query as a cancellable task
-        task = asyncio.create_task(run_query(ws, word, lang, target_lang, tl_model))
-        await task
+        #checked up front, tl_model also ends up as a metrics label
+        if tl_model not in TL_MODELS:
+            await send_json(ws, {"type": "error", "detail": f"Unsupported tl_model, supported: {list(TL_MODELS)}"})
+            await ws.close()
+            return
+
+        #a list of target languages is answered with one "results" message, holding a result per language
+        #the elements are checked before deduplicating, which would fail on unhashable ones
+        if isinstance(target_lang, list) and target_lang and all(isinstance(tl, str) for tl in target_lang):
+            target_lang = list(dict.fromkeys(target_lang))
+        elif not isinstance(target_lang, str):
+            await send_json(ws, {"type": "error", "detail": "target_lang must be a language code or a non-empty list of them"})
+            await ws.close()
+            return
+
+        #optional: per-stage timings and counters in the progress and result messages
+        send_stats = data.get("stats", False)
+
+        #optional: dump the fetched entries and the full result to stdout
+        debug = data.get("debug", False)
+
+        user = query_user(ws, data)
+        cancel = threading.Event()
+
+        #run the query as a task, while watching for the client to leave
+        task = asyncio.create_task(admitted_query(ws, user, word, lang, target_lang, tl_model, send_stats, debug, cancel))
+        watcher = asyncio.create_task(wait_for_disconnect(ws))
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+
+        if not task.done():
+            raise WebSocketDisconnect()
+
+        #raises the query's exception, if any
+        task.result()
 
         await ws.close()
 
-    except WebSocketDisconnect:
+    except admission.QueueFull:
+        #too many queries waiting, the client should try again later
+        await send_json(ws, {"type": "error", "detail": "Server busy, too many queries waiting, try again later"})
+        await ws.close(code=1013)
+
+    except (WebSocketDisconnect, QueryCancelled):
         print("Client disconnected")
+        metrics.inc("vocabdict_queries_cancelled_total")
+        if cancel:
+            #stops the query stages running in threads at their next check
+            cancel.set()
         if task:
             task.cancel()
             try:
                 await task
-            except asyncio.CancelledError:
-                print("Query task cancelled successfully")
\ No newline at end of file
+            except (asyncio.CancelledError, QueryCancelled, WebSocketDisconnect):
+                print("Query task cancelled successfully")
+
+    finally:
+        if watcher:
+            watcher.cancel()
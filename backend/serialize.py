@@ -0,0 +1,64 @@
+import os
+import json
+from fastapi.responses import Response
+
+#json encoding for websocket messages, http responses and stored vocab data
+#orjson is used if it is installed, the standard library json module otherwise
+#the backend can be forced with VOCABDICT_JSON=orjson|json
+#both produce compact utf-8 json, with non-string keys (e.g. int entry offsets) converted to strings
+
+BACKENDS = ("orjson", "json")
+
+JSON_BACKEND = os.environ.get("VOCABDICT_JSON")
+
+if JSON_BACKEND not in (None, *BACKENDS):
+    raise ValueError(f"Unknown VOCABDICT_JSON '{JSON_BACKEND}', expected one of {BACKENDS}")
+
+orjson = None
+if JSON_BACKEND != "json":
+    try:
+        import orjson
+    except ImportError:
+        if JSON_BACKEND == "orjson":
+            raise
+
+backend = "orjson" if orjson else "json"
+
+
+if orjson:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    #obj as json bytes
+    def dumps(obj):
+        return orjson.dumps(obj, option=_OPTIONS)
+
+    #obj as indented json text, for debug output
+    def pretty(obj):
+        return orjson.dumps(obj, option=_OPTIONS | orjson.OPT_INDENT_2).decode("utf-8")
+
+    #parses json from bytes or str, raises a json.JSONDecodeError subclass on invalid input
+    loads = orjson.loads
+
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def dumps(obj):
+        return _encoder.encode(obj).encode("utf-8")
+
+    def pretty(obj):
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+
+    loads = json.loads
+
+
+#obj as json text, for websocket text frames and TEXT columns
+def dumps_str(obj):
+    return dumps(obj).decode("utf-8")
+
+
+#json response encoded with the selected backend
+class JSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
@@ -0,0 +1,177 @@
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+
+import metrics
+import inference
+
+#pre-fork server: loads the models once in a parent process, then forks uvicorn workers that share them
+"""
+python serve.py --host 127.0.0.1 --port 8766 --workers 4
+VOCABDICT_NLLB_BACKEND=int8 VOCABDICT_EMBED_BACKEND=int8 python serve.py --workers 8
+"""
+#with `uvicorn query:app --workers N` every worker imports the app and loads its own copy of NLLB and MiniLM,
+#here the workers inherit the parent's copy, whose pages stay shared copy-on-write as long as nobody writes to them:
+#   - the parent only loads the models and never runs inference, so no model threads exist when it forks
+#   - gc.freeze() moves everything loaded so far out of the garbage collector's reach, so collections in the
+#     workers do not write to (and thereby copy) the pages the shared objects live on
+#rss counts shared pages in every worker, compare vocabdict_process_pss_bytes across worker counts instead
+#onnx runtime sessions and cuda contexts do not survive a fork, with those backends every worker loads its own models
+#with VOCABDICT_INFERENCE_WORKERS set the models live in the inference workers, and nothing is preloaded
+
+#a worker that exits sooner than this after being started is restarted only after this delay, to not spin on a crash
+RESTART_DELAY = 1
+
+
+#whether models of backend can be loaded before forking
+def fork_safe(backend):
+    if backend in ("int8", "stub"):
+        return True
+    if backend == "torch":
+        #asks nvml instead of initializing cuda, which the parent would otherwise do just by checking,
+        #leaving the forked workers with a cuda runtime they cannot use
+        os.environ.setdefault("PYTORCH_NVML_BASED_CUDA_CHECK", "1")
+        import torch
+        return not torch.cuda.is_available()
+    return False
+
+
+#imports the app and loads all models that can be shared, returns the load time per model in seconds
+def preload():
+    #nothing is collected while loading, and everything loaded is frozen before forking
+    gc.disable()
+
+    import query
+
+    timings = {}
+    if query.translators.worker_pool:
+        print("Models run in the inference workers, nothing to preload")
+        return timings
+
+    for name, backend, load in (
+        ("nllb", inference.NLLB_BACKEND, inference.load_nllb),
+        ("embedder", inference.EMBED_BACKEND, inference.load_embedder),
+    ):
+        if not fork_safe(backend):
+            print(f"The {backend} backend of {name} cannot be shared with forked workers, every worker loads its own")
+            continue
+        start = time.perf_counter()
+        load(backend)
+        timings[name] = time.perf_counter() - start
+
+    return timings
+
+
+def bind(host, port, backlog):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+#runs one uvicorn worker on the shared socket, in the forked child
+def run_worker(sock, args):
+    import uvicorn
+    import query
+
+    gc.enable()
+
+    config = uvicorn.Config(query.app, log_level=args.log_level, backlog=args.backlog,
+                            timeout_graceful_shutdown=args.graceful_timeout)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+#forks a worker and records it in workers, with the stop signals held back until it is recorded
+def spawn(sock, args, workers):
+    signals = {signal.SIGTERM, signal.SIGINT}
+    signal.pthread_sigmask(signal.SIG_BLOCK, signals)
+    pid = os.fork()
+    if pid == 0:
+        #uvicorn installs its own handlers for graceful shutdown
+        for signum in signals:
+            signal.signal(signum, signal.SIG_DFL)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, signals)
+        code = 0
+        try:
+            run_worker(sock, args)
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            code = 1
+        finally:
+            #never fall back into the parent's supervision loop
+            os._exit(code)
+    workers[pid] = time.monotonic()
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, signals)
+
+
+def serve(args):
+    timings = preload()
+    for name, seconds in timings.items():
+        print(f"Loaded {name} in {seconds:.1f}s")
+
+    sock = bind(args.host, args.port, args.backlog)
+
+    gc.collect()
+    gc.freeze()
+    print(f"Parent rss {metrics.process_rss() / 2**20:.0f} MiB, forking {args.workers} workers "
+          f"on http://{args.host}:{args.port}", flush=True)
+
+    #pid -> start time
+    workers = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(args.workers):
+        spawn(sock, args, workers)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+
+        started = workers.pop(pid, None)
+        if started is None or stopping:
+            continue
+
+        print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting", flush=True)
+        if time.monotonic() - started < RESTART_DELAY:
+            time.sleep(RESTART_DELAY)
+        if not stopping:
+            spawn(sock, args, workers)
+
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the api from pre-forked workers that share one copy of the models")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--backlog", type=int, default=2048, help="maximum number of pending connections")
+    parser.add_argument("--graceful_timeout", type=int, default=30, help="seconds running requests get to finish on shutdown")
+    parser.add_argument("--log_level", default="info")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        sys.exit("serve.py needs os.fork, use `uvicorn query:app --workers N` on this platform")
+
+    serve(args)
@@ -0,0 +1,51 @@
+import os
+import sys
+
+#the backend modules import each other by their flat names, as when run from the backend directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#cheap argon2 parameters, read by hashing.py on import, also in its spawned worker processes
+os.environ.setdefault("VOCABDICT_ARGON2_TIME_COST", "1")
+os.environ.setdefault("VOCABDICT_ARGON2_MEMORY_COST", "1024")
+os.environ.setdefault("VOCABDICT_ARGON2_PARALLELISM", "1")
+
+#no models are needed by the api tests
+os.environ.setdefault("VOCABDICT_NLLB_BACKEND", "stub")
+os.environ.setdefault("VOCABDICT_EMBED_BACKEND", "stub")
+
+import sqlite3
+
+import pytest
+
+
+#test client of the app, running in an empty directory (query.py resolves its files relative to the working directory)
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    import query
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "jwt_key.txt").write_text("test-secret")
+    query.secret_key.cache_clear()
+
+    with TestClient(query.app) as client:
+        yield client
+
+
+#authorization headers of a newly registered user
+@pytest.fixture
+def auth(client):
+    user = {"username": "tester", "password": "password123"}
+    assert client.post("/register", json=user).status_code == 200
+    token = client.post("/login", json=user).json()["token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+#creates a collection with one chapter, returns (collection id, chapter id)
+@pytest.fixture
+def chapter(client, auth):
+    collection_id = client.post("/createCollection", headers=auth, json={"name": "collection"}).json()["id"]
+    assert client.post(f"/collections/{collection_id}/chapters", headers=auth, json={"name": "chapter"}).status_code == 200
+    with sqlite3.connect("vocab_data.sqlite") as db:
+        chapter_id = db.execute("SELECT max(id) FROM chapters").fetchone()[0]
+    return collection_id, chapter_id
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from admission import Admission, QueueFull
+
+
+#starts acquire(user) as a task and lets it run until it is admitted or waits
+async def start(admission, user):
+    task = asyncio.ensure_future(admission.acquire(user))
+    await asyncio.sleep(0)
+    return task
+
+
+def test_blocked_user_does_not_hold_up_others():
+    async def run():
+        admission = Admission(max_active=2, max_queued=10, per_user=1)
+        a1 = await start(admission, "a")
+        a2 = await start(admission, "a")
+        b = await start(admission, "b")
+
+        assert a1.done()
+        #a is at its limit, b takes the free slot past a's waiting query
+        assert not a2.done()
+        assert b.done()
+        assert admission.active == 2
+
+        admission.release("a")
+        await asyncio.sleep(0)
+        assert a2.done()
+
+    asyncio.run(run())
+
+
+def test_fifo_within_limits():
+    async def run():
+        admission = Admission(max_active=1, max_queued=10, per_user=0)
+        first = await start(admission, "a")
+        second = await start(admission, "b")
+        third = await start(admission, "c")
+        assert first.done() and not second.done() and not third.done()
+
+        admission.release("a")
+        await asyncio.sleep(0)
+        assert second.done() and not third.done()
+
+    asyncio.run(run())
+
+
+def test_queue_full():
+    async def run():
+        admission = Admission(max_active=1, max_queued=1, per_user=0)
+        await start(admission, "a")
+        await start(admission, "b")
+        with pytest.raises(QueueFull):
+            await admission.acquire("c")
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def run():
+        admission = Admission(max_active=1, max_queued=10, per_user=0)
+        await start(admission, "a")
+        waiting = await start(admission, "b")
+        waiting.cancel()
+        await asyncio.sleep(0)
+        assert admission.waiting == []
+
+        admission.release("a")
+        assert admission.active == 0
+
+    asyncio.run(run())
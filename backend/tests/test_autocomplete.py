@@ -0,0 +1,60 @@
+import os
+import sqlite3
+
+import pytest
+
+import autocomplete
+from autocomplete import AutocompleteIndex, build
+
+
+#builds the de index in tmp_path from {word: number of entries}
+def build_index(tmp_path, words):
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE de_offsets (word TEXT, offset INTEGER)")
+    db.executemany("INSERT INTO de_offsets VALUES (?, ?)", [(w, i) for w, n in words.items() for i in range(n)])
+    build("de", db, str(tmp_path))
+    return AutocompleteIndex("de", str(tmp_path))
+
+
+def words(index, prefix, **kwargs):
+    return [r["word"] for r in index.complete(prefix, **kwargs)]
+
+
+def test_prefix_ranking(tmp_path):
+    index = build_index(tmp_path, {"haus": 1, "hausboot": 3, "hausen": 3, "hauser": 1, "hund": 5})
+    #the word itself first, then by entries and length
+    assert words(index, "haus") == ["haus", "hausen", "hausboot", "hauser"]
+    assert words(index, "Hau", limit=2) == ["hausen", "hausboot"]
+    assert index.complete("h")[0] == {"word": "hund", "entries": 5, "fuzzy": False}
+
+
+def test_fuzzy(tmp_path):
+    index = build_index(tmp_path, {"katze": 2, "kater": 1, "hund": 1})
+    results = index.complete("kaz")
+    assert results[0] == {"word": "katze", "entries": 2, "fuzzy": True}
+    assert words(index, "kaz", fuzzy=False) == []
+
+
+def test_prefixes_with_more_words_than_scanned(tmp_path):
+    many = {f"ka{i:05d}": 1 for i in range(autocomplete.SCAN_LIMIT + 1000)}
+    index = build_index(tmp_path, {**many, "k": 1, "kind": 7, "kiste": 3, "zebra": 9})
+
+    #"kind" sorts after all "ka..." words, beyond the scanned ones
+    assert words(index, "k", limit=3) == ["k", "kind", "kiste"]
+    assert words(index, "ki", fuzzy=False) == ["kind", "kiste"]
+    assert len(words(index, "ka", limit=50)) == 50
+    assert "ka" in index.top and "ka0" in index.top and "ki" not in index.top
+
+
+def test_rebuild_swaps_generations(tmp_path):
+    old = build_index(tmp_path, {"alt": 1})
+    new = build_index(tmp_path, {"neu": 1})
+    build_index(tmp_path, {"neuer": 1})
+
+    #the index opened before the rebuilds keeps reading its own files
+    assert words(old, "a") == ["alt"]
+    assert words(new, "n") == ["neu"]
+    assert words(AutocompleteIndex("de", str(tmp_path)), "n") == ["neuer"]
+
+    #the current and the previous generation are kept
+    assert sorted(f for f in os.listdir(tmp_path) if f.endswith(".txt")) == ["de_autocomplete.2.txt", "de_autocomplete.3.txt"]
@@ -0,0 +1,31 @@
+import pytest
+
+import bench
+import query
+
+
+#a small synthetic de and en dictionary in the client's directory
+@pytest.fixture
+def dictionary(client, tmp_path):
+    bench.make_dictionaries(str(tmp_path), words=20)
+    bench.build_indices(str(tmp_path))
+
+
+@pytest.mark.parametrize("lang, target_lang", [("de", "ko"), ("de", "ja"), ("de", "EN-GB"), ("en", "de")])
+def test_supported_pairs(client, dictionary, lang, target_lang):
+    r = client.get("/get_empty_entry", params={"lang": lang, "target_lang": target_lang})
+    assert r.status_code == 200
+    assert "custom" in r.json()
+
+
+@pytest.mark.parametrize("lang, target_lang", [("fr", "ko"), ("de", "not a language"), ("de", "")])
+def test_unsupported_pairs(client, dictionary, lang, target_lang):
+    assert client.get("/get_empty_entry", params={"lang": lang, "target_lang": target_lang}).status_code == 400
+
+
+def test_cache_is_bounded(client, dictionary):
+    query.empty_entry.cache_clear()
+    for a in "abcdefghij":
+        for b in "abcdefghij":
+            client.get("/get_empty_entry", params={"lang": "de", "target_lang": a + b})
+    assert query.empty_entry.cache_info().currsize == query.EMPTY_ENTRY_CACHE_SIZE
@@ -0,0 +1,39 @@
+import os
+import signal
+import asyncio
+
+import pytest
+
+from hashing import HashPool
+
+
+@pytest.fixture
+def pool():
+    pool = HashPool(workers=1, max_queue=4)
+    yield pool
+    pool.shutdown()
+
+
+def test_hash_and_verify(pool):
+    async def run():
+        password_hash = await pool.hash("secret")
+        assert await pool.verify(password_hash, "secret") == (True, None)
+        assert await pool.verify(password_hash, "wrong") == (False, None)
+
+    asyncio.run(run())
+
+
+def test_recovers_from_killed_worker(pool):
+    async def run():
+        password_hash = await pool.hash("secret")
+        broken = pool.executor
+
+        #as if the worker was killed for its memory use
+        for process in list(broken._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+            process.join()
+
+        assert (await pool.verify(password_hash, "secret"))[0]
+        assert pool.executor is not broken
+
+    asyncio.run(run())
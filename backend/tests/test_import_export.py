@@ -0,0 +1,112 @@
+import json
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import query
+
+
+#request whose body arrives in the given chunks
+class ChunkedRequest:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.headers = {}
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def lines(chunks, max_size=None):
+    async def collect():
+        return [line async for line in query.iter_ndjson(ChunkedRequest(chunks), max_size)]
+    return asyncio.run(collect())
+
+
+def test_iter_ndjson_splits_across_chunks():
+    body = b'{"a": 1}\n\n{"b": "' + b"x" * 10000 + b'"}\r\n{"c": 3}'
+    expected = [b'{"a": 1}', b'{"b": "' + b"x" * 10000 + b'"}\r', b'{"c": 3}']
+    for size in (1, 7, 4096, len(body)):
+        assert lines([body[i:i + size] for i in range(0, len(body), size)]) == expected
+
+
+def test_iter_ndjson_size_limit():
+    with pytest.raises(HTTPException) as e:
+        lines([b'{"a": 1}\n'] * 10, max_size=50)
+    assert e.value.status_code == 413
+
+
+def ndjson(items):
+    return "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in items)
+
+
+def parse(text):
+    return [json.loads(line) for line in text.splitlines()]
+
+
+VOCAB = [
+    {"name": "Katze", "data": {"5": {"word": "Katze", "senses": {"1": {"de": "Tier", "ko": "고양이", "tags": []}}}}},
+    {"name": "Hund", "data": {}},
+]
+
+
+def test_chapter_round_trip(client, auth, chapter):
+    collection_id, chapter_id = chapter
+    r = client.post(f"/chapters/{chapter_id}/import", headers=auth, content=ndjson(VOCAB))
+    assert r.json()["count"] == 2
+
+    exported = client.get(f"/chapters/{chapter_id}/export", headers=auth).text
+    assert parse(exported) == VOCAB
+
+    #the export imports again as is
+    client.post(f"/collections/{collection_id}/chapters", headers=auth, json={"name": "copy"})
+    chapters = client.get(f"/collections/{collection_id}/chapters", headers=auth).json()
+    copy_id = max(c["id"] for c in chapters)
+    assert client.post(f"/chapters/{copy_id}/import", headers=auth, content=exported).status_code == 200
+    assert client.get(f"/chapters/{copy_id}/export", headers=auth).text == exported
+
+
+def test_collection_round_trip(client, auth, chapter):
+    collection_id, _ = chapter
+    items = [{"chapter": "chapter", **VOCAB[0]}, {"chapter": "new", **VOCAB[1]}, {"chapter": "empty"}]
+    r = client.post(f"/collections/{collection_id}/import", headers=auth, content=ndjson(items))
+    assert r.json()["count"] == 2 and r.json()["chapters_created"] == 2
+
+    exported = client.get(f"/collections/{collection_id}/export", headers=auth).text
+    assert parse(exported) == items
+
+    other = client.post("/createCollection", headers=auth, json={"name": "other"}).json()["id"]
+    assert client.post(f"/collections/{other}/import", headers=auth, content=exported).status_code == 200
+    assert client.get(f"/collections/{other}/export", headers=auth).text == exported
+
+
+@pytest.mark.parametrize("body, detail", [
+    ('{"name": "a", "data": {}}\n{"data": {}}\n', "line 2"),
+    ('{"name": "a", "data": {}}\nnot json\n', "line 2"),
+    ('{"name": "a", "data": []}\n', "line 1"),
+    ('[1, 2]\n', "line 1"),
+])
+def test_broken_import_imports_nothing(client, auth, chapter, body, detail):
+    _, chapter_id = chapter
+    r = client.post(f"/chapters/{chapter_id}/import", headers=auth, content=body)
+    assert r.status_code == 400 and detail in r.json()["detail"].lower()
+    assert client.get(f"/chapters/{chapter_id}/export", headers=auth).text == ""
+
+
+def test_import_too_large(client, auth, chapter, monkeypatch):
+    _, chapter_id = chapter
+    monkeypatch.setattr(query, "IMPORT_MAX_SIZE", 100)
+    r = client.post(f"/chapters/{chapter_id}/import", headers=auth, content=ndjson(VOCAB * 10))
+    assert r.status_code == 413
+
+
+def test_foreign_chapter(client, auth, chapter):
+    _, chapter_id = chapter
+    other = {"username": "other", "password": "password123"}
+    client.post("/register", json=other)
+    token = client.post("/login", json=other).json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get(f"/chapters/{chapter_id}/export", headers=headers).status_code == 404
+    assert client.post(f"/chapters/{chapter_id}/import", headers=headers, content=ndjson(VOCAB)).status_code == 404
@@ -0,0 +1,82 @@
+import pytest
+
+from query import apply_vocab_patch, parse_patch_path
+
+
+#stored vocab data as read back from the database: all keys are strings
+def stored():
+    return {
+        "5": {
+            "word": "cat",
+            "senses": {
+                "null": {"en": "a small animal", "ko": "고양이", "ex": {"0": {"en": "A cat.", "ko": "고양이."}}},
+                "1": {"en": "a person", "ko": "사람", "tags": ["informal"]},
+            },
+        },
+    }
+
+
+def test_paths_of_collect_to_be_translated():
+    data = apply_vocab_patch(stored(), [
+        {"op": "replace", "path": [5, "senses", None, "ko"], "value": "냥이"},
+        {"op": "replace", "path": [5, "senses", None, "ex", 0, "ko"], "value": "냥."},
+        {"op": "replace", "path": [5, "senses", "1", "ko"], "value": "녀석"},
+    ])
+    assert data["5"]["senses"]["null"]["ko"] == "냥이"
+    assert data["5"]["senses"]["null"]["ex"]["0"]["ko"] == "냥."
+    assert data["5"]["senses"]["1"]["ko"] == "녀석"
+
+
+def test_json_pointer_paths():
+    assert parse_patch_path("/5/senses/a~1b/x~0y") == ["5", "senses", "a/b", "x~y"]
+    assert parse_patch_path("") == []
+
+    data = apply_vocab_patch(stored(), [
+        {"op": "add", "path": "/5/senses/1/tags/-", "value": "rare"},
+        {"op": "add", "path": "/5/senses/1/tags/0", "value": "first"},
+        {"op": "remove", "path": "/5/senses/null/ex/0"},
+    ])
+    assert data["5"]["senses"]["1"]["tags"] == ["first", "informal", "rare"]
+    assert data["5"]["senses"]["null"]["ex"] == {}
+
+
+@pytest.mark.parametrize("op", [
+    {"op": "replace", "path": [5, "senses", "2", "ko"], "value": "x"},
+    {"op": "remove", "path": "/5/missing"},
+    {"op": "replace", "path": "/5/senses/1/tags/1", "value": "x"},
+    {"op": "replace", "path": "/5/word"},
+    {"op": "add", "path": "/5/new"},
+    {"op": "replace", "path": "", "value": None},
+    {"op": "replace", "path": "", "value": []},
+    {"op": "remove", "path": ""},
+    {"op": "move", "path": "/5/word", "value": "x"},
+    {"op": "replace", "path": "5/word", "value": "x"},
+])
+def test_invalid_ops(op):
+    with pytest.raises(ValueError):
+        apply_vocab_patch(stored(), [op])
+
+
+def test_root_replace_with_object():
+    assert apply_vocab_patch(stored(), [{"op": "replace", "path": "", "value": {"1": {}}}]) == {"1": {}}
+
+
+def test_patch_endpoint(client, auth, chapter):
+    _, chapter_id = chapter
+    #int and None keys, as in query results, are stored as strings
+    data = {5: {"word": "cat", "senses": {None: {"en": "a small animal", "ko": "고양이"}}}}
+    vocab_id = client.post(f"/chapters/{chapter_id}/vocab", headers=auth, json={"name": "cat", "data": data}).json()["id"]
+    url = f"/chapters/{chapter_id}/vocab/{vocab_id}"
+
+    r = client.patch(url, headers=auth, json={"ops": [{"op": "replace", "path": [5, "senses", None, "ko"], "value": "냥이"}]})
+    assert r.status_code == 200
+
+    #all or nothing: the valid first op is not applied either
+    r = client.patch(url, headers=auth, json={"ops": [
+        {"op": "replace", "path": "/5/word", "value": "dog"},
+        {"op": "replace", "path": "", "value": None},
+    ]})
+    assert r.status_code == 400
+
+    stored = client.get(f"/vocab_data/{chapter_id}/{vocab_id}", headers=auth).json()["data"]
+    assert stored == {"5": {"word": "cat", "senses": {"null": {"en": "a small animal", "ko": "냥이"}}}}
@@ -0,0 +1,22 @@
+import json
+
+import pytest
+
+
+def query(client, **request):
+    with client.websocket_connect("/ws/query") as ws:
+        ws.send_json({"word": "katze", "lang": "de", "target_lang": "ko", "tl_model": "NLLB", **request})
+        return json.loads(ws.receive_text())
+
+
+@pytest.mark.parametrize("target_lang", [[{}], [["ko"]], [], ["ko", 1], {"ko": 1}, 5, None])
+def test_invalid_target_lang(client, target_lang):
+    message = query(client, target_lang=target_lang)
+    assert message["type"] == "error"
+    assert "target_lang" in message["detail"]
+
+
+def test_unsupported_tl_model(client):
+    message = query(client, tl_model="GPT")
+    assert message["type"] == "error"
+    assert "tl_model" in message["detail"]
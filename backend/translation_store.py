@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import functools
+
+#translations of glosses and example sentences, per language pair and model (see translators.model_key)
+#filled in bulk by pretranslate.py and on the fly by live queries, which consult it before running a model
+#model output is only kept if the store is enabled, by setting VOCABDICT_TRANSLATION_STORE to its path
+DEFAULT_DB = "./wiktionary/translations.db"
+STORE_DB = os.environ.get("VOCABDICT_TRANSLATION_STORE", "")
+
+#maximum number of texts per lookup query, below sqlite's limit of bound parameters
+LOOKUP_CHUNK = 500
+
+
+def enabled():
+    return bool(STORE_DB)
+
+
+#creates the store, once per process
+@functools.cache
+def init(path):
+    conn = sqlite3.connect(path, timeout=30)
+
+    #the batch job writes while queries read, the journal mode is stored in the database file
+    conn.execute("PRAGMA journal_mode=WAL")
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS translations (
+        lang TEXT,
+        target_lang TEXT,
+        model TEXT,
+        source TEXT,
+        translation TEXT,
+        PRIMARY KEY (lang, target_lang, model, source)
+    ) WITHOUT ROWID
+    """)
+
+    #how far pretranslate.py got through a dump, per language pair and model
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS progress (
+        lang TEXT,
+        target_lang TEXT,
+        model TEXT,
+        dump TEXT,
+        offset INTEGER,
+        PRIMARY KEY (lang, target_lang, model, dump)
+    )
+    """)
+    conn.commit()
+    conn.close()
+
+
+def connect(path=None):
+    path = path or STORE_DB
+    init(path)
+    return sqlite3.connect(path, timeout=30)
+
+
+#returns the stored translations of texts as a dict source -> translation, texts without one are left out
+def lookup(conn, lang, target_lang, model, texts):
+    texts = list(dict.fromkeys(texts))
+    found = {}
+
+    for i in range(0, len(texts), LOOKUP_CHUNK):
+        chunk = texts[i: i + LOOKUP_CHUNK]
+        rows = conn.execute(f"""
+            SELECT source, translation FROM translations
+            WHERE lang = ? AND target_lang = ? AND model = ? AND source IN ({",".join("?" * len(chunk))})
+        """, (lang, target_lang, model, *chunk))
+        found.update(rows)
+
+    return found
+
+
+#stores (source, translation) pairs, the caller commits
+def store(conn, lang, target_lang, model, pairs):
+    conn.executemany(
+        "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)",
+        [(lang, target_lang, model, source, translation) for source, translation in pairs],
+    )
+
+
+#offset in dump up to which all entries are translated
+def get_progress(conn, lang, target_lang, model, dump):
+    row = conn.execute(
+        "SELECT offset FROM progress WHERE lang = ? AND target_lang = ? AND model = ? AND dump = ?",
+        (lang, target_lang, model, dump),
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def set_progress(conn, lang, target_lang, model, dump, offset):
+    conn.execute("INSERT OR REPLACE INTO progress VALUES (?, ?, ?, ?, ?)", (lang, target_lang, model, dump, offset))
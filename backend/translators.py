@@ -0,0 +1,174 @@
+import json
+import functools
+import requests
+
+import inference
+import inference_worker
+from inference import lang_code_map
+
+#translation models of the api (query.py) and the batch jobs (pretranslate.py):
+#NLLB (in-process, or in the inference workers), Deepseek over openrouter, and DeepL
+#kept apart from the api, so the batch jobs can translate without importing it
+
+#separate inference worker processes, if configured with VOCABDICT_INFERENCE_WORKERS, otherwise None (in-process)
+worker_pool = inference_worker.pool_from_env()
+
+#translates the list of words from lang to target_lang using NLLB distilled model
+def nllb_translate(words, lang, target_lang):
+
+    if not words:
+        print("No words to translate.")
+        return []
+
+    #Check for unsupported language codes (to be added as needed)
+    if lang not in lang_code_map or target_lang not in lang_code_map:
+        raise ValueError(f"Unsupported lang code. Supported: {list(lang_code_map.keys())}")
+    
+    #get appropriate src and tgt codes from lang_code_map
+    src = lang_code_map[lang]
+    tgt = lang_code_map[target_lang]
+
+    if worker_pool:
+        return worker_pool.translate(words, src, tgt)
+
+    #the model is loaded once, with the backend selected by VOCABDICT_NLLB_BACKEND
+    return inference.translate(words, src, tgt)
+
+
+#reads an api key from a file
+def load_key(path):
+    with open(path, "r") as f:
+        return f.read().strip()
+
+@functools.cache
+def openrouter_api_key():
+    return load_key("OR_key.txt")
+
+openrouter_url = "https://openrouter.ai/api/v1/chat/completions"
+model_id = "deepseek/deepseek-r1:free"  
+
+
+#sends the strings to deepseek, returns their translations, or None if deepseek failed (e.g. rate limit, invalid json)
+def deepseek_request(words, lang, target_lang):
+    headers = {
+        "Authorization": f"Bearer {openrouter_api_key()}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "http://localhost",
+        "User-Agent": "VocabDict/1.0 (luisdrayer@web.de)"
+    }
+
+    system_role = "You are a translation tool."
+
+    prompt = {
+        "role": "user",
+        "content": (
+            f"Translate the following {lang} sentences into {target_lang}. "
+            f"Return the result strictly as a JSON object with keys 'original' and 'translation' "
+            f"for each sentence, like:\n"
+            f"[{{'original': '...', 'translation': '...'}}, ...]\n\n"
+            f"Sentences:\n{words}"
+        )
+    }
+
+    payload = {
+        "model": model_id,
+        "messages": [
+            {"role": "system", "content": system_role},
+            prompt,
+        ],
+    }
+
+    try:
+        resp = requests.post(openrouter_url, headers=headers, json=payload)
+        resp.raise_for_status()
+        content_str = resp.json()["choices"][0]["message"]["content"]
+    except requests.exceptions.HTTPError as e:
+        if e.response.status_code == 429:
+            print("DeepSeek rate-limited (429). Using backup translator...")
+        else:
+            print(f"DeepSeek request failed ({e}). Using backup translator...")
+        return None
+
+    # parse JSON safely
+    try:
+        content_list = json.loads(content_str.replace("'", '"'))
+        return [item["translation"] for item in content_list]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        print("DeepSeek returned invalid JSON, falling back to backup translator.")
+        return None
+
+#translates the list of strings using deepseek, with nllb as backup
+def deepseek_translate(words, lang, target_lang):
+    return translate_with_model(words, lang, target_lang, "Deepseek")[0]
+
+
+# load the DeepL api key
+def load_DeepL_key(path="DeepL_key.txt"):
+    with open(path, "r") as f:
+        return f.read().strip()
+
+@functools.cache
+def DeepL_api_key():
+    return load_DeepL_key()
+
+DeepL_url = "https://api-free.deepl.com/v2/translate"
+
+#translates the list of strings using DeepL
+def deepl_translate(words, lang, target_lang):
+    if not words:
+        print("No words to translate.")
+        return []
+    
+    headers = {
+        "Authorization": f"DeepL-Auth-Key {DeepL_api_key()}"
+    }
+
+    # DeepL requires multiple 'text' fields for multiple sentences
+    data = [("text", w) for w in words]  # list of tuples
+    data += [
+        ("source_lang", lang),
+        ("target_lang", target_lang)
+    ]
+
+    resp = requests.post(DeepL_url, headers=headers, data=data)
+    resp.raise_for_status()
+    #pprint(resp.json())
+    return [t["text"] for t in resp.json()["translations"]]
+
+
+#translation models a query can choose from
+TL_MODELS = ("NLLB", "Deepseek", "DeepL")
+
+#the model that produces the translations of tl_model, as translations are stored under it,
+#including the NLLB backend (int8 output differs from fp32) and the Deepseek model version
+#with inference workers, the api has to be configured with the same VOCABDICT_NLLB_BACKEND as the workers
+def model_key(tl_model):
+    match tl_model:
+        case "NLLB":
+            return f"NLLB/{inference.NLLB_BACKEND}"
+        case "Deepseek":
+            return f"Deepseek/{model_id}"
+        case "DeepL":
+            return "DeepL"
+    raise ValueError(f"Unsupported translation model '{tl_model}'. Supported: {list(TL_MODELS)}")
+
+#translates the list of strings with the given model
+#returns the translations and the model_key of the model that actually produced them, as Deepseek falls back to NLLB
+def translate_with_model(words, lang, target_lang, tl_model):
+    key = model_key(tl_model)
+    match tl_model:
+        case "NLLB":
+            return nllb_translate(words, lang, target_lang), key
+        case "Deepseek":
+            if not words:
+                return [], key
+            translated = deepseek_request(words, lang, target_lang)
+            if translated is None:
+                return nllb_translate(words, lang, target_lang), model_key("NLLB")
+            return translated, key
+        case "DeepL":
+            return deepl_translate(words, lang, target_lang), key
+
+#translates the list of strings with the given model
+def translate(words, lang, target_lang, tl_model):
+    return translate_with_model(words, lang, target_lang, tl_model)[0]
@@ -77,7 +77,7 @@ class _QueryFieldState extends State<QueryField> {
 
     setState(() {
       queryText = data["name"];
-      _responseNotifier.value = jsonDecode(data["data"]);
+      _responseNotifier.value = data["data"];
     });
   }
 
@@ -126,6 +126,14 @@ class _QueryFieldState extends State<QueryField> {
           });
           _channel!.sink.close();
         }
+        //case: error (e.g. queue full, unsupported tl_model) -> show it and stop loading
+        else if (decoded["type"] == "error") {
+          setState(() {
+            _log = "Error: ${decoded["detail"]}";
+            _isLoading = false;
+          });
+          _channel!.sink.close();
+        }
         //case: not json -> log
       } catch (_) {
         //set message to log for display
@@ -133,6 +141,13 @@ class _QueryFieldState extends State<QueryField> {
           _log = message;
         });
       }
+    }, onDone: () {
+      //connection closed without a result (e.g. server error), stop loading
+      if (_isLoading && mounted) {
+        setState(() {
+          _isLoading = false;
+        });
+      }
     });
 
     // clear input field